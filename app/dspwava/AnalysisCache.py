@@ -0,0 +1,126 @@
+import numpy as np
+import inspect
+import logging
+from functools import wraps
+from collections import OrderedDict
+LOGGER = logging.getLogger(__name__)
+# default number of bytes of results each signal may keep
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+def result_nbytes(result) -> int:
+    """returns the approximate memory held by an analysis result (arrays, scalars, tuples of them and objects with an nbytes attribute)"""
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, (tuple, list)):
+        return sum(result_nbytes(r) for r in result)
+    return getattr(result, 'nbytes', 64)
+
+def _freeze(result):
+    """marks result arrays read-only so callers cannot corrupt the cached copy"""
+    if isinstance(result, np.ndarray):
+        result.setflags(write=False)
+    elif isinstance(result, (tuple, list)):
+        for r in result:
+            _freeze(r)
+    return result
+
+class SvAnalysisCache:
+    """LRU memo of analysis results for one signal, keyed by operation and parameters.
+
+    Every entry belongs to a data version. When the signal's data version moves on (any mutation), the whole cache is
+    dropped on the next lookup. The total size of the stored results is kept under max_bytes by evicting the least
+    recently used entries.
+    """
+    def __init__(self, max_bytes:int=DEFAULT_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        """Drops all entries. Statistics are kept."""
+        self.entries.clear()
+        self.nbytes = 0
+
+    def get(self, key, version):
+        """Returns (True, result) for a cached key at the given data version, (False, None) otherwise"""
+        if version != self.version:
+            self.clear()
+            self.version = version
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, self.entries[key][0]
+        self.misses += 1
+        return False, None
+
+    def put(self, key, result, version):
+        """Stores a result computed at the given data version, evicting old entries to stay within max_bytes"""
+        size = result_nbytes(result)
+        if version != self.version or size > self.max_bytes:
+            return
+        self.entries[key] = (result, size)
+        self.nbytes += size
+        self._shrink()
+
+    def setBudget(self, max_bytes:int):
+        """Changes the byte budget, evicting entries if needed"""
+        self.max_bytes = max_bytes
+        self._shrink()
+
+    def _shrink(self):
+        """evicts least recently used entries until the cache fits its budget"""
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.nbytes -= evicted
+            self.evictions += 1
+
+    def getStats(self) -> dict:
+        """returns hit/miss/eviction counts and the current size of the cache"""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes}
+
+def cached(method):
+    """Memoizes an SvSignal analysis method in the signal's SvAnalysisCache.
+
+    The key is the method name plus its bound arguments (defaults applied), so getSpectrogram() and
+    getSpectrogram(nperseg=256) share an entry. Calls with unhashable arguments are not cached.
+    Cached arrays are returned read-only. Misses are looked up in the signal's disk cache, if it has one.
+    """
+    sig = inspect.signature(method)
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        bound = sig.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = (method.__name__,) + tuple(bound.arguments.items())[1:]
+        try:
+            hash(key)
+        except TypeError:
+            return method(self, *args, **kwargs)
+        cache = self.getCache()
+        version = self.getDataVersion()
+        found, result = cache.get(key, version)
+        if found:
+            return result
+        # results of signals read from files are also kept across runs, see SvDiskCache
+        disk_key = self._diskKey(key)
+        if disk_key is not None:
+            found, result = self.getDiskCache().get(disk_key)
+            if found:
+                cache.put(key, result, version)
+                return result
+        result = _freeze(method(self, *args, **kwargs))
+        cache.put(key, result, version)
+        if disk_key is not None:
+            self.getDiskCache().put(disk_key, result)
+        return result
+    return wrapper
@@ -0,0 +1,273 @@
+"""
+Batch processing of audio files with a declarative pipeline.
+
+A pipeline is a list of steps. A step is an operation name, or a dict with an 'op' key plus the operation's parameters:
+
+    [{"op": "load", "mmap": true},
+     "toMono",
+     {"op": "high_pass_filter", "cutoff_freq": 80},
+     {"op": "resample", "new_samplerate": 16000},
+     "normalize",
+     "estimate_frequency",
+     "getSpectrogram",
+     {"op": "getFeatures", "features": ["rms", "centroid", "flux"]},
+     {"op": "write", "suffix": "_clean"}]
+
+Transform steps modify the signal, analysis steps add a column to the summary. Files are spread over a process pool in
+chunks, every file is processed independently and a failing file only gets its error recorded in the summary.
+
+    dspwava-batch recordings/ --pipeline pipeline.json --output-dir out/ --summary out/summary.npz --workers 8
+
+With --cache-dir cache/ analysis results are kept on disk, keyed by file content, so a rerun over an unchanged corpus
+loads them instead of decoding and recomputing (see SvDiskCache). With --profile out/profile.json (or .csv) every file is processed under an SvProfiler and the timings, samples and
+allocations of each operation are gathered from the workers into one report.
+"""
+import argparse
+import concurrent.futures
+import csv
+import fnmatch
+import json
+import logging
+import os
+import time
+import numpy as np
+from concurrent.futures.process import BrokenProcessPool
+from .Signal import SvSignal
+from . import ExtraFilters
+from .Profiler import SvProfiler
+LOGGER = logging.getLogger(__name__)
+DEFAULT_PATTERNS = ('*.wav', '*.flac', '*.ogg', '*.mp3', '*.aiff', '*.aif')
+
+def _write(signal:SvSignal, context:dict, directory:str=None, suffix:str='', extension:str=None):
+    out_dir = directory or context["output_dir"]
+    if out_dir is None:
+        raise ValueError("write step needs a directory parameter or an output directory")
+    stem, ext = os.path.splitext(os.path.basename(context['path']))
+    out_path = os.path.join(out_dir, stem + suffix + (extension or ext))
+    os.makedirs(out_dir, exist_ok=True)
+    signal.write(out_path)
+    return out_path
+
+def _spectrogram(signal:SvSignal, context:dict, **params):
+    f, t, spect = signal.getSpectrogram(**params)
+    if context['output_dir'] is None:
+        return 'x'.join(str(n) for n in spect.shape)
+    stem = os.path.splitext(os.path.basename(context['path']))[0]
+    out_path = os.path.join(context['output_dir'], stem + '.spectrogram.npz')
+    os.makedirs(context['output_dir'], exist_ok=True)
+    np.savez(out_path, f=f, t=t, spectrogram=spect)
+    return out_path
+
+def _features(signal:SvSignal, context:dict, features=None, **params):
+    result = signal.getFeatures(None if features is None else tuple(features), **params)
+    if context['output_dir'] is None:
+        return len(result)
+    stem = os.path.splitext(os.path.basename(context['path']))[0]
+    # named steps get their own file, getFeatures steps write <stem>.features.npy
+    out_path = os.path.join(context['output_dir'], f"{stem}.{context['column'].replace('getFeatures', 'features')}.npy")
+    os.makedirs(context['output_dir'], exist_ok=True)
+    np.save(out_path, result)
+    return out_path
+
+def _pitch(signal:SvSignal, context:dict, **params):
+    _, pitch = signal.getPitchEstimate(**params)
+    voiced = pitch[pitch > 0]
+    return float(np.median(voiced)) if len(voiced) else 0.0
+
+# operations that modify the signal: name -> function(signal, **params)
+TRANSFORMS = {
+    'toMono': lambda signal: signal.toMono(),
+    'resample': lambda signal, new_samplerate: signal.resample(new_samplerate),
+    'normalize': lambda signal, target_amplitude=1.0: signal.normalize(target_amplitude),
+    'high_pass_filter': lambda signal, **params: ExtraFilters.high_pass_filter(signal, **params),
+    'low_pass_filter': lambda signal, **params: ExtraFilters.low_pass_filter(signal, **params),
+}
+# operations that produce a summary value: name -> function(signal, context, **params)
+ANALYSES = {
+    'getDuration': lambda signal, context: signal.getDuration(),
+    'getAmplitude': lambda signal, context: float(signal.getAmplitude()),
+    'getSampleRate': lambda signal, context: signal.getSampleRate(),
+    'getNumChannels': lambda signal, context: signal.getNumChannels(),
+    'estimate_frequency': lambda signal, context, **params: float(signal.estimate_frequency(**params)),
+    'getPitchEstimate': _pitch,
+    'getSpectrogram': _spectrogram,
+    'getFeatures': _features,
+    'write': _write,
+}
+
+def parse_step(step) -> dict:
+    """Normalizes a step to a dict with an 'op' key. Accepts dicts, operation names and 'op:key=value,key=value' strings,
+    where values are parsed as JSON when possible (high_pass_filter:cutoff_freq=80)."""
+    if isinstance(step, dict):
+        step = dict(step)
+    else:
+        op, _, args = str(step).partition(':')
+        step = {'op': op}
+        for arg in filter(None, args.split(',')):
+            key, _, value = arg.partition('=')
+            try:
+                step[key] = json.loads(value)
+            except ValueError:
+                step[key] = value
+    if step.get('op') not in TRANSFORMS and step.get('op') not in ANALYSES and step.get('op') != 'load':
+        raise ValueError(f"Unknown pipeline operation {step.get('op')!r}")
+    return step
+
+def load_pipeline(path:str) -> list:
+    """Reads a JSON list of steps from path"""
+    with open(path) as f:
+        return [parse_step(step) for step in json.load(f)]
+
+def process_file(path:str, pipeline:list, output_dir:str=None, profile:bool=False) -> dict:
+    """Runs the pipeline on one file and returns its summary row. Errors are caught and recorded, never raised.
+    With profile the row carries the SvProfiler records of the file under 'profile'."""
+    row = {'file': path, 'status': 'ok', 'error': '', 'seconds': 0.0}
+    start = time.perf_counter()
+    context = {'path': path, 'output_dir': output_dir}
+    profiler = SvProfiler().start() if profile else None
+    try:
+        steps = [parse_step(step) for step in pipeline]
+        load = {}
+        if steps and steps[0]['op'] == 'load':
+            load = steps.pop(0)
+            load.pop('op')
+        signal = SvSignal(filepath=path, **load)
+        for step in steps:
+            params = dict(step)
+            op = params.pop('op')
+            column = params.pop('name', op)
+            if op in TRANSFORMS:
+                TRANSFORMS[op](signal, **params)
+            else:
+                context['column'] = column
+                row[column] = ANALYSES[op](signal, context, **params)
+    except Exception as e:
+        LOGGER.error(f'{path}: {e}')
+        row['status'] = 'error'
+        row['error'] = f'{type(e).__name__}: {e}'
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            row['profile'] = profiler.records
+    row['seconds'] = time.perf_counter() - start
+    return row
+
+def _process_chunk(paths:list, pipeline:list, output_dir:str, profile:bool=False) -> list:
+    return [process_file(path, pipeline, output_dir, profile) for path in paths]
+
+def find_files(inputs:list, patterns=DEFAULT_PATTERNS, recursive:bool=True) -> list:
+    """Expands files and directories into a sorted list of audio files matching the patterns"""
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, names in os.walk(item):
+                files.extend(os.path.join(root, n) for n in names if any(fnmatch.fnmatch(n.lower(), p) for p in patterns))
+                if not recursive:
+                    break
+        else:
+            files.append(item)
+    return sorted(files)
+
+def run_batch(files:list, pipeline:list, workers:int=None, chunksize:int=None, output_dir:str=None, summary_path:str=None,
+              profile_path:str=None, cache_dir:str=None) -> list:
+    """Runs the pipeline over files on a process pool and returns one summary row per file, in input order.
+
+    Files are submitted in chunks of chunksize to amortize inter-process overhead. A file that raises is recorded as an
+    error. If a worker process dies outright, the files of its chunk are retried one by one in a fresh pool and any file
+    that kills a worker again is recorded as an error too. With profile_path every file is profiled and the records of
+    all workers are written there, see SvProfiler.save. cache_dir gives every signal a disk cache shared by the workers.
+    """
+    pipeline = [parse_step(step) for step in pipeline]
+    if cache_dir:
+        if not pipeline or pipeline[0]['op'] != 'load':
+            pipeline.insert(0, {'op': 'load'})
+        pipeline[0].setdefault('disk_cache', cache_dir)
+    workers = workers or os.cpu_count() or 1
+    chunksize = chunksize or max(1, min(64, len(files) // (workers * 4) or 1))
+    chunks = [files[i:i + chunksize] for i in range(0, len(files), chunksize)]
+    rows = {}
+    retry = []
+    LOGGER.info(f'Processing {len(files)} files in {len(chunks)} chunks on {workers} workers')
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(_process_chunk, chunk, pipeline, output_dir, bool(profile_path)): chunk for chunk in chunks}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                for row in future.result():
+                    rows[row['file']] = row
+            except BrokenProcessPool:
+                retry.extend(futures[future])
+    for path in retry:
+        # one pool per file, so a crash only takes that file down
+        with concurrent.futures.ProcessPoolExecutor(1) as pool:
+            try:
+                rows[path] = pool.submit(process_file, path, pipeline, output_dir, bool(profile_path)).result()
+            except BrokenProcessPool as e:
+                rows[path] = {'file': path, 'status': 'error', 'error': f'worker crashed: {e}', 'seconds': 0.0}
+    rows = [rows[path] for path in files]
+    if profile_path:
+        profiler = SvProfiler()
+        for row in rows:
+            profiler.extend(row.pop('profile', []))
+        profiler.save(profile_path)
+    if summary_path:
+        write_summary(rows, summary_path)
+    failed = sum(row['status'] != 'ok' for row in rows)
+    LOGGER.info(f'Processed {len(rows)} files, {failed} failed')
+    return rows
+
+def summary_columns(rows:list) -> dict:
+    """Turns summary rows into columns. Numeric columns become float arrays with NaN for missing values."""
+    names = []
+    for row in rows:
+        names.extend(k for k in row if k not in names)
+    columns = {}
+    for name in names:
+        values = [row.get(name) for row in rows]
+        if all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values):
+            columns[name] = np.array([np.nan if v is None else v for v in values], dtype=float)
+        else:
+            columns[name] = np.array(['' if v is None else str(v) for v in values])
+    return columns
+
+def write_summary(rows:list, path:str):
+    """Writes the summary as columns: .npz stores one array per column, anything else is written as CSV"""
+    columns = summary_columns(rows)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith('.npz'):
+        np.savez(path, **columns)
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns.keys())
+            writer.writerows(zip(*columns.values()))
+    LOGGER.info(f'Summary written to {path}')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='dspwava-batch', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help='audio files or directories')
+    parser.add_argument('--pipeline', help='JSON file with the list of steps')
+    parser.add_argument('--step', action='append', default=[], help="a step such as toMono or high_pass_filter:cutoff_freq=80, may be repeated")
+    parser.add_argument('--pattern', action='append', help='file name patterns to pick up in directories (default common audio types)')
+    parser.add_argument('--no-recursive', action='store_true', help='do not descend into sub directories')
+    parser.add_argument('--output-dir', help='where write and getSpectrogram steps put their files')
+    parser.add_argument('--summary', default='summary.npz', help='summary file, .npz for column arrays or .csv')
+    parser.add_argument('--workers', type=int, help='worker processes (default cpu count)')
+    parser.add_argument('--chunksize', type=int, help='files per submitted task')
+    parser.add_argument('--cache-dir', help='directory of the persistent analysis cache, shared by runs and workers')
+    parser.add_argument('--profile', help='profile every operation and write the report here, .json or .csv')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(asctime)s <%(levelname)s> [%(name)s] %(message)s', datefmt='%H:%M:%S',
+                        level=logging.INFO if args.verbose else logging.WARNING)
+    pipeline = load_pipeline(args.pipeline) if args.pipeline else []
+    pipeline += [parse_step(step) for step in args.step]
+    if not pipeline:
+        parser.error('no pipeline given, use --pipeline or --step')
+    files = find_files(args.inputs, tuple(args.pattern) if args.pattern else DEFAULT_PATTERNS, not args.no_recursive)
+    rows = run_batch(files, pipeline, args.workers, args.chunksize, args.output_dir, args.summary, args.profile, args.cache_dir)
+    failed = sum(row['status'] != 'ok' for row in rows)
+    print(f'{len(rows)} files processed, {failed} failed, summary in {args.summary}')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,163 @@
+import numpy as np
+import hashlib
+import logging
+from collections import OrderedDict
+from .Fft import rfft, irfft, next_fast_len
+LOGGER = logging.getLogger(__name__)
+# number of impulse responses whose partition spectra are kept around
+IR_CACHE_SIZE = 32
+# roughly how many input samples are transformed together in one batch
+BATCH_SAMPLES = 1 << 18
+_IR_CACHE = OrderedDict()
+
+def choose_blocksize(ir_length:int, min_blocksize:int=64) -> int:
+    """Picks the partition size that minimizes the estimated flops per output sample of a uniformly partitioned convolution.
+
+    Each block costs a forward and an inverse real FFT of twice the block size plus one complex multiply-add per bin and partition.
+    Small blocks mean many partitions, large blocks mean long transforms.
+    """
+    best, best_cost = min_blocksize, np.inf
+    blocksize = min_blocksize
+    while True:
+        fft_size = 2 * blocksize
+        partitions = -(-ir_length // blocksize)
+        cost = (2 * 2.5 * fft_size * np.log2(fft_size) + 8 * partitions * (fft_size // 2 + 1)) / blocksize
+        if cost < best_cost:
+            best, best_cost = blocksize, cost
+        if blocksize >= ir_length:
+            return best
+        blocksize *= 2
+
+def transform_size(blocksize:int) -> int:
+    """returns the FFT size used with blocksize: at least twice the block size, so a block convolved with a partition
+    does not wrap around, rounded up to a size the FFT backend is fast at. Equal to 2 * blocksize for powers of two."""
+    return next_fast_len(2 * blocksize, real=True)
+
+def _as_2d(data:np.ndarray) -> np.ndarray:
+    """returns a (frames, channels) view of mono or multichannel samples"""
+    return data[:, np.newaxis] if data.ndim == 1 else data
+
+def get_partition_spectra(impulse:np.ndarray, blocksize:int) -> np.ndarray:
+    """Returns the (partitions, transform_size(blocksize) // 2 + 1, channels) spectra of the impulse response cut into blocks of blocksize samples.
+    Results are cached by impulse response content, so the same IR applied to many signals is only transformed once."""
+    impulse = np.ascontiguousarray(_as_2d(impulse))
+    nfft = transform_size(blocksize)
+    key = (hashlib.blake2b(impulse.tobytes(), digest_size=16).hexdigest(), impulse.shape, impulse.dtype.str, blocksize, nfft)
+    if key in _IR_CACHE:
+        _IR_CACHE.move_to_end(key)
+        return _IR_CACHE[key]
+    partitions = -(-len(impulse) // blocksize)
+    padded = np.zeros((partitions * blocksize, impulse.shape[1]), dtype=impulse.dtype)
+    padded[:len(impulse)] = impulse
+    spectra = rfft(padded.reshape(partitions, blocksize, -1), n=nfft, axis=1)
+    _IR_CACHE[key] = spectra
+    if len(_IR_CACHE) > IR_CACHE_SIZE:
+        _IR_CACHE.popitem(last=False)
+    return spectra
+
+class SvConvolver:
+    """Uniformly partitioned FFT overlap-add convolution of signals with a fixed impulse response.
+
+    The impulse response is cut into partitions of blocksize samples whose spectra are computed once. Input is
+    processed in blocks, each block spectrum is multiplied with every partition spectrum and the results are
+    overlap-added, so the cost per sample grows with log(blocksize) + partitions instead of with the IR length.
+
+    Feed chunks of any size to process() and call flush() at the end to stream a long input through the IR with
+    bounded memory, or call convolve() for a whole array. Mono and multichannel data are both supported: a mono IR is
+    applied to every input channel, a mono input is convolved with every IR channel, otherwise the channel counts must match.
+    With dtype the impulse response is converted first, float32 convolves in complex64.
+    """
+    def __init__(self, impulse:np.ndarray, blocksize:int=None, dtype=None) -> None:
+        if dtype is not None:
+            impulse = np.asarray(impulse, dtype=dtype)
+        self.ir_length = len(impulse)
+        if self.ir_length == 0:
+            raise ValueError("Impulse response is empty")
+        self.blocksize = choose_blocksize(self.ir_length) if blocksize is None else blocksize
+        self.ir_channels = 1 if impulse.ndim == 1 else impulse.shape[1]
+        self.nfft = transform_size(self.blocksize)
+        self.spectra = get_partition_spectra(impulse, self.blocksize)
+        self.reset()
+
+    def reset(self):
+        """Clears the streaming state so a new signal can be processed"""
+        self._pending = None
+        self._history = None
+        self._carry = None
+        self._samples_in = 0
+        self._samples_out = 0
+        self._mono = None
+
+    def _setup(self, chunk:np.ndarray):
+        """Allocates the streaming state on the first chunk, once the input channel count is known"""
+        in_channels = 1 if chunk.ndim == 1 else chunk.shape[1]
+        if in_channels != self.ir_channels and 1 not in (in_channels, self.ir_channels):
+            raise ValueError(f"Cannot convolve {in_channels} channel audio with a {self.ir_channels} channel impulse response")
+        channels = max(in_channels, self.ir_channels)
+        partitions, bins = self.spectra.shape[:2]
+        dtype = np.result_type(chunk.dtype, np.float32)
+        self._mono = chunk.ndim == 1 and self.ir_channels == 1
+        self._pending = np.zeros((0, in_channels), dtype=dtype)
+        self._history = np.zeros((partitions - 1, bins, in_channels), dtype=self.spectra.dtype)
+        self._carry = np.zeros((self.blocksize, channels), dtype=dtype)
+
+    def _processBlocks(self, blocks:np.ndarray) -> np.ndarray:
+        """Convolves whole blocks, shape (nblocks * blocksize, in_channels), and returns the same number of finished output samples"""
+        B = self.blocksize
+        partitions = len(self.spectra)
+        nblocks = len(blocks) // B
+        spectra = rfft(blocks.reshape(nblocks, B, -1), n=self.nfft, axis=1)
+        # the previous partitions - 1 block spectra still contribute to the current output blocks
+        extended = np.concatenate((self._history, spectra)) if partitions > 1 else spectra
+        acc = extended[partitions - 1:] * self.spectra[0]
+        for p in range(1, partitions):
+            acc += extended[partitions - 1 - p:partitions - 1 - p + nblocks] * self.spectra[p]
+        if partitions > 1:
+            self._history = extended[-(partitions - 1):]
+        y = irfft(acc, n=self.nfft, axis=1, overwrite_x=True).astype(self._carry.dtype, copy=False)
+        # overlap-add the second half of every block onto the first half of the next one
+        out = y[:, :B].copy()
+        out[0] += self._carry
+        out[1:] += y[:-1, B:2 * B]
+        self._carry = y[-1, B:2 * B]
+        return out.reshape(nblocks * B, -1)
+
+    def _run(self, data:np.ndarray) -> np.ndarray:
+        """Convolves a whole number of blocks in batches, so temporaries stay bounded however long data is"""
+        batch = max(1, BATCH_SAMPLES // self.blocksize) * self.blocksize
+        outs = [self._processBlocks(data[start:start + batch]) for start in range(0, len(data), batch)]
+        if not outs:
+            return np.zeros((0, self._carry.shape[1]), dtype=self._carry.dtype)
+        return np.concatenate(outs) if len(outs) > 1 else outs[0]
+
+    def _emit(self, out:np.ndarray) -> np.ndarray:
+        self._samples_out += len(out)
+        return out[:, 0] if self._mono else out
+
+    def process(self, chunk:np.ndarray) -> np.ndarray:
+        """Feeds the next chunk of input and returns the output samples that are complete. Output lags input by less than one block."""
+        if self._pending is None:
+            self._setup(chunk)
+        self._samples_in += len(chunk)
+        data = np.concatenate((self._pending, _as_2d(chunk)))
+        usable = len(data) // self.blocksize * self.blocksize
+        self._pending = data[usable:]
+        return self._emit(self._run(data[:usable]))
+
+    def flush(self) -> np.ndarray:
+        """Returns the remaining output, including the impulse response tail, and resets the streaming state"""
+        if self._pending is None:
+            return np.zeros(0)
+        remaining = self._samples_in + self.ir_length - 1 - self._samples_out
+        nblocks = -(-remaining // self.blocksize)
+        tail = np.zeros((nblocks * self.blocksize, self._pending.shape[1]), dtype=self._pending.dtype)
+        tail[:len(self._pending)] = self._pending
+        out = self._emit(self._run(tail)[:remaining])
+        self.reset()
+        return out
+
+    def convolve(self, data:np.ndarray) -> np.ndarray:
+        """Returns the full convolution of data with the impulse response, len(data) + ir_length - 1 samples long"""
+        self.reset()
+        head = self.process(data)
+        return np.concatenate((head, self.flush()))
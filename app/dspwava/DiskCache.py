@@ -0,0 +1,230 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from functools import lru_cache, wraps
+import numpy as np
+LOGGER = logging.getLogger(__name__)
+# default number of bytes of results a cache directory may hold
+DEFAULT_DISK_CACHE_BYTES = 1 << 30
+HASH_CHUNK = 1 << 20
+# layout of the entries, part of every key. Bump it when the way results are stored changes
+CACHE_FORMAT = 1
+
+@lru_cache(maxsize=1)
+def code_version() -> str:
+    """returns a digest of the package's source files. It is part of every key, so results computed by another version
+    of the analyses are never served."""
+    digest = hashlib.blake2b(digest_size=16)
+    package = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(package)):
+        if name.endswith('.py'):
+            digest.update(name.encode())
+            with open(os.path.join(package, name), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+def _is_scalar(value) -> bool:
+    return isinstance(value, (bool, int, float, complex, np.generic))
+
+def storable(result) -> bool:
+    """returns True for results the disk cache can hold: arrays, scalars and tuples or lists of them"""
+    if isinstance(result, (tuple, list)):
+        return all(isinstance(r, np.ndarray) or _is_scalar(r) for r in result)
+    return isinstance(result, np.ndarray) or _is_scalar(result)
+
+class SvDiskCache:
+    """Persistent cache of analysis results shared by every signal and process that uses the same directory.
+
+    Entries are keyed by a content hash of the source file (blake2b of its bytes, re-hashed only when the file's size
+    or modification time changes), the sample dtype, the operations that derived the signal from the file, and the
+    analysis with its parameters, salted with CACHE_FORMAT and the code_version of the package. A result is stored as one .npy file per array (or scalar) and loaded memory mapped,
+    read-only, so a warm run reads only the pages it touches.
+
+    Writers build an entry in a private temporary directory and publish it with an atomic os.replace, so readers in
+    other processes see a complete entry or none, and two writers racing on one key just keep the first. Reads refresh
+    an entry's modification time; when the directory outgrows max_bytes the least recently used entries are renamed
+    away atomically and deleted. An entry that disappears while it is being read is a miss.
+    """
+    def __init__(self, directory:str, max_bytes:int=DEFAULT_DISK_CACHE_BYTES) -> None:
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        for sub in ('entries', 'files', 'tmp'):
+            os.makedirs(os.path.join(self.directory, sub), exist_ok=True)
+
+    def _tmp(self) -> str:
+        return os.path.join(self.directory, 'tmp', f'{os.getpid()}-{uuid.uuid4().hex}')
+
+    def fileDigest(self, path:str) -> str:
+        """returns the content hash of a file, remembered per (path, size, mtime) so unchanged files are hashed once"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        memo = os.path.join(self.directory, 'files', hashlib.sha1(path.encode()).hexdigest() + '.json')
+        try:
+            with open(memo) as f:
+                known = json.load(f)
+            if known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+                return known['digest']
+        except (OSError, ValueError, KeyError):
+            pass
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        tmp = self._tmp()
+        with open(tmp, 'w') as f:
+            json.dump({'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest}, f)
+        os.replace(tmp, memo)
+        return digest
+
+    def key(self, *parts) -> str:
+        """returns the entry name for a key made of reprs of its parts, the cache format and the code version"""
+        return hashlib.sha256(repr((CACHE_FORMAT, code_version()) + parts).encode()).hexdigest()
+
+    def _entry(self, key:str) -> str:
+        return os.path.join(self.directory, 'entries', key)
+
+    def get(self, key:str):
+        """Returns (True, result) if the entry exists, (False, None) otherwise"""
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, 'meta.json')) as f:
+                meta = json.load(f)
+            parts = []
+            for i, kind in enumerate(meta['parts']):
+                value = np.load(os.path.join(entry, f'{i}.npy'), mmap_mode='r' if kind == 'array' else None)
+                parts.append(value if kind == 'array' else value.item())
+            os.utime(entry)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        if meta['kind'] == 'single':
+            return True, parts[0]
+        return True, tuple(parts) if meta['kind'] == 'tuple' else parts
+
+    def put(self, key:str, result) -> bool:
+        """Stores a result unless it is not storable or the entry exists. Returns True if this call published it."""
+        if not storable(result):
+            return False
+        entry = self._entry(key)
+        if os.path.exists(entry):
+            return False
+        values = list(result) if isinstance(result, (tuple, list)) else [result]
+        meta = {'kind': 'tuple' if isinstance(result, tuple) else 'list' if isinstance(result, list) else 'single',
+                'parts': ['array' if isinstance(v, np.ndarray) else 'scalar' for v in values]}
+        tmp = self._tmp()
+        os.makedirs(tmp)
+        try:
+            for i, value in enumerate(values):
+                np.save(os.path.join(tmp, f'{i}.npy'), np.asarray(value), allow_pickle=False)
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp, entry)
+        except OSError:
+            # another process published the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+            return False
+        self.stores += 1
+        self.shrink()
+        return True
+
+    def entries(self) -> list:
+        """returns (last use, bytes, name) of every entry"""
+        found = []
+        with os.scandir(os.path.join(self.directory, 'entries')) as it:
+            for entry in it:
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                    found.append((entry.stat().st_mtime, size, entry.name))
+                except OSError:
+                    continue
+        return found
+
+    def nbytes(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def shrink(self, max_bytes:int=None):
+        """Evicts the least recently used entries until the directory holds at most max_bytes of results"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= max_bytes:
+                break
+            trash = self._tmp()
+            try:
+                # readers see the entry whole or not at all
+                os.replace(self._entry(name), trash)
+            except OSError:
+                continue
+            shutil.rmtree(trash, ignore_errors=True)
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        self.shrink(0)
+
+    def getStats(self) -> dict:
+        """returns this process's hit/miss/store/eviction counts and the size of the directory"""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'stores': self.stores, 'evictions': self.evictions, 'nbytes': self.nbytes(), 'max_bytes': self.max_bytes}
+
+# the cache new signals use when they are not given one
+_default_cache = None
+
+def set_disk_cache(cache):
+    """Sets the disk cache new signals use: an SvDiskCache, a directory, or None to disable"""
+    global _default_cache
+    _default_cache = SvDiskCache(cache) if isinstance(cache, str) else cache
+
+def get_disk_cache():
+    """returns the disk cache new signals use, or None"""
+    return _default_cache
+
+def derived(method=None, *, defer:bool=True):
+    """Marks a deterministic SvSignal mutator, or a function or method taking the signal as its `signal` argument. The
+    operation's name and its other bound arguments are appended to the signal's lineage, so results of the derived
+    signal keep their own disk cache entries. Equivalent implementations with the same name and arguments share them
+    (SvParallel's filters and ExtraFilters'). Any other mutation makes the lineage unknown and disables the disk cache
+    for that signal.
+
+    On a signal whose file has not been decoded yet (see SvSignal's disk_cache) the operation is only recorded, and runs
+    when the samples or the metadata are first needed. Analyses of the final lineage found in the disk cache are then
+    served without decoding the file or running the operations. Errors of a deferred operation surface at that point.
+    A deferred call returns the signal if the function is annotated to return one, None otherwise. Operations that hold
+    resources the signal cannot keep (SvParallel's pool) use @derived(defer=False) and always run at once."""
+    if method is None:
+        return lambda method: derived(method, defer=defer)
+    import inspect
+    sig = inspect.signature(method)
+    signal_name = 'signal' if 'signal' in sig.parameters else next(iter(sig.parameters))
+    # parameters before the signal (self of a method) are not part of the operation
+    first_argument = list(sig.parameters).index(signal_name) + 1
+    returns_signal = sig.return_annotation is not inspect.Signature.empty
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        bound = sig.bind(*args, **kwargs)
+        signal = bound.arguments[signal_name]
+        lineage = signal._lineage
+        if lineage is None:
+            return method(*args, **kwargs)
+        bound.apply_defaults()
+        derived_lineage = lineage + ((method.__name__,) + tuple(bound.arguments.items())[first_argument:],)
+        if defer and signal._lazy and signal._data is None:
+            signal._deferred.append((method, signal_name, dict(bound.arguments), lineage))
+            signal.touch()
+            signal._lineage = derived_lineage
+            return signal if returns_signal else None
+        result = method(*args, **kwargs)
+        signal._lineage = derived_lineage
+        return result
+    return wrapper
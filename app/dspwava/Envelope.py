@@ -0,0 +1,92 @@
+import numpy as np
+import logging
+LOGGER = logging.getLogger(__name__)
+# samples per bin of the finest level of the pyramid
+BASE_BIN = 64
+# each level has factor times fewer bins than the one below it
+LEVEL_FACTOR = 4
+# stop adding levels once a level has at most this many bins
+MIN_BINS = 1024
+
+def minmax_bins(data:np.ndarray, size:int) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the per bin (min, max) of mono or (frames, channels) data cut into bins of size frames, the last one partial"""
+    if len(data) == 0:
+        return data[:0], data[:0]
+    starts = np.arange(0, len(data), size)
+    return np.minimum.reduceat(data, starts, axis=0), np.maximum.reduceat(data, starts, axis=0)
+
+class SvEnvelope:
+    """Multi-resolution min/max envelope of a signal, for drawing waveforms of any length.
+
+    Level k holds the minimum and maximum of every BASE_BIN * LEVEL_FACTOR**k frames, as float32. The levels are built
+    in one pass over the signal's blocks, so streamed and memory mapped signals are never loaded whole. getView() returns
+    about one min/max pair per screen pixel for any visible range, reduced from the coarsest level whose bins are still
+    no wider than a pixel, or from the samples themselves when zoomed in that far.
+    """
+    def __init__(self, signal, base:int=BASE_BIN, factor:int=LEVEL_FACTOR) -> None:
+        signal.validDataCheck()
+        self.signal = signal
+        self.frames = signal.getNumFrames()
+        self.samplerate = signal.getSampleRate()
+        self.bins = [base]
+        blocksize = max(base, signal.blocksize // base * base)
+        mins, maxs = [], []
+        for block in signal.blocks(blocksize):
+            lo, hi = minmax_bins(block, base)
+            mins.append(lo.astype(np.float32))
+            maxs.append(hi.astype(np.float32))
+        self.levels = [(np.concatenate(mins), np.concatenate(maxs))]
+        while len(self.levels[-1][0]) > MIN_BINS:
+            lo, hi = self.levels[-1]
+            self.levels.append((minmax_bins(lo, factor)[0], minmax_bins(hi, factor)[1]))
+            self.bins.append(self.bins[-1] * factor)
+        self.nbytes = sum(lo.nbytes + hi.nbytes for lo, hi in self.levels)
+        LOGGER.debug(f'Envelope of {self.frames} frames: {len(self.levels)} levels, {self.nbytes} bytes')
+
+    def getRange(self) -> tuple[np.ndarray, np.ndarray]:
+        """returns the overall (min, max) of the signal, per channel"""
+        lo, hi = self.levels[-1]
+        return lo.min(axis=0), hi.max(axis=0)
+
+    def getView(self, start:int, stop:int, pixels:int, channel:int=None) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (frame positions, values) to draw frames start to stop on pixels screen pixels.
+
+        When there are fewer than two frames per pixel the samples themselves are returned. Otherwise every pixel
+        gets its minimum and maximum, in that order, so a connected line covers the full envelope. channel picks
+        one column of a multichannel signal.
+        """
+        start, stop = max(0, int(start)), min(self.frames, int(np.ceil(stop)))
+        pixels = max(1, int(pixels))
+        if stop <= start:
+            return np.zeros(0), np.zeros(0)
+        per_pixel = (stop - start) / pixels
+        if per_pixel < 2:
+            values = self.signal._readFrames(start, stop)
+            if channel is not None and values.ndim == 2:
+                values = values[:, channel]
+            return np.arange(start, stop), values
+        # coarsest level whose bins are still no wider than a pixel, the raw samples if none is
+        level = None
+        for i, size in enumerate(self.bins):
+            if size <= per_pixel:
+                level = i
+        if level is None:
+            size = 1
+            lo = hi = self.signal._readFrames(start, stop)
+            first = start
+        else:
+            size = self.bins[level]
+            first = start // size
+            last = -(-stop // size)
+            lo, hi = self.levels[level][0][first:last], self.levels[level][1][first:last]
+            first *= size
+        if channel is not None and lo.ndim == 2:
+            lo, hi = lo[:, channel], hi[:, channel]
+        group = max(1, int(per_pixel // size))
+        lo, hi = minmax_bins(lo, group)[0], minmax_bins(hi, group)[1]
+        positions = first + np.arange(len(lo)) * group * size
+        xs = np.repeat(positions, 2).astype(float)
+        xs[1::2] += group * size / 2
+        ys = np.empty((2 * len(lo),) + lo.shape[1:], dtype=lo.dtype)
+        ys[0::2], ys[1::2] = lo, hi
+        return xs, ys
@@ -0,0 +1,114 @@
+import numpy as np
+import logging
+from .Frames import frame_signal, get_window, BATCH_SAMPLES
+from .Fft import rfft
+LOGGER = logging.getLogger(__name__)
+# every feature, in the order of the fields of the result
+FEATURES = ('rms', 'zcr', 'centroid', 'rolloff', 'flux', 'peak_frequency', 'peak_magnitude')
+# features computed from the frame samples, the rest need the spectrum
+TIME_FEATURES = ('rms', 'zcr')
+
+class SvFeatureExtractor:
+    """Per-frame features from one framing and FFT pass.
+
+    Frames are frame_size samples every hop_size samples, multichannel frames are averaged to mono, the same frames
+    estimate_frequency looks at. Blocks of samples are fed to process() in order, the frames of each block are
+    transformed in batches of about BATCH_SAMPLES samples with a single rfft, and every requested feature is read off
+    the same samples and spectra:
+
+        rms             root mean square of the frame
+        zcr             fraction of consecutive samples that change sign
+        centroid        magnitude weighted mean frequency, Hz
+        rolloff         frequency below which rolloff_percent of the spectral magnitude lies, Hz
+        flux            L2 distance between the magnitude spectra of the frame and the previous one (0 for the first)
+        peak_frequency  frequency of the strongest bin of the windowed frame, Hz, as estimate_frequency picks it
+        peak_magnitude  magnitude of that bin
+
+    Results are float32 rows of a structured array with a float64 'time' field, the centre of the frame in seconds.
+    """
+    def __init__(self, samplerate, features=FEATURES, frame_size:int=2048, hop_size:int=1024, window:str='hanning', rolloff_percent:float=0.85) -> None:
+        features = tuple(features)
+        unknown = [f for f in features if f not in FEATURES]
+        if unknown:
+            raise ValueError(f'Unknown features {unknown}, choose from {FEATURES}')
+        if not 0 < rolloff_percent <= 1:
+            raise ValueError('rolloff_percent must be in (0, 1]')
+        self.samplerate = samplerate
+        self.features = tuple(f for f in FEATURES if f in features)
+        self.frame_size = frame_size
+        self.hop_size = hop_size
+        self.window = window
+        self.rolloff_percent = rolloff_percent
+        self.spectral = any(f not in TIME_FEATURES for f in self.features)
+        self.frequencies = np.fft.rfftfreq(frame_size, 1 / samplerate)
+        self.dtype = np.dtype([('time', np.float64)] + [(f, np.float32) for f in self.features])
+        self.reset()
+
+    def reset(self):
+        """Forgets the previous spectrum, so the next block starts a new signal"""
+        self._previous = None
+
+    def numFrames(self, samples:int) -> int:
+        """returns the number of whole frames in a signal of the given length"""
+        return 0 if samples < self.frame_size else 1 + (samples - self.frame_size) // self.hop_size
+
+    def empty(self, frames:int=0) -> np.ndarray:
+        """returns an uninitialised result for the given number of frames"""
+        return np.empty(frames, dtype=self.dtype)
+
+    def process(self, data:np.ndarray, first_frame:int=0, out:np.ndarray=None) -> np.ndarray:
+        """Computes the features of the whole frames of a block of samples. first_frame is the index of the block's
+        first frame in the signal, for the time field. Writes into out when given, else returns a new array."""
+        frames = frame_signal(data, self.frame_size, self.hop_size)
+        if out is None:
+            out = self.empty(len(frames))
+        batch_frames = max(1, BATCH_SAMPLES // (self.frame_size * (data.shape[1] if data.ndim == 2 else 1)))
+        win = get_window(self.window, self.frame_size, np.result_type(data.dtype, np.float32).name)
+        for start in range(0, len(frames), batch_frames):
+            batch = frames[start:start + batch_frames]
+            if batch.ndim == 3:
+                batch = batch.mean(axis=1)
+            self._batch(batch, win, out[start:start + len(batch)], first_frame + start)
+        return out
+
+    def _batch(self, batch:np.ndarray, win:np.ndarray, out:np.ndarray, first_frame:int):
+        """fills out with the features of a (frames, frame_size) batch of mono frames"""
+        out['time'] = ((first_frame + np.arange(len(batch))) * self.hop_size + self.frame_size / 2) / self.samplerate
+        if 'rms' in self.features:
+            out['rms'] = np.sqrt(np.einsum('ij,ij->i', batch, batch) / self.frame_size)
+        if 'zcr' in self.features:
+            negative = np.signbit(batch)
+            out['zcr'] = np.count_nonzero(negative[:, 1:] != negative[:, :-1], axis=1) / (self.frame_size - 1)
+        if not self.spectral:
+            return
+        magnitude = np.abs(rfft(batch * win, axis=-1))
+        total = magnitude.sum(axis=1)
+        # silent frames have no centroid or rolloff, they get 0
+        safe_total = np.where(total > 0, total, 1)
+        if 'centroid' in self.features:
+            out['centroid'] = magnitude @ self.frequencies.astype(magnitude.dtype) / safe_total
+        if 'rolloff' in self.features:
+            cumulative = np.cumsum(magnitude, axis=1)
+            below = np.count_nonzero(cumulative < self.rolloff_percent * cumulative[:, -1:], axis=1)
+            out['rolloff'] = np.where(total > 0, self.frequencies[np.minimum(below, len(self.frequencies) - 1)], 0)
+        if 'flux' in self.features:
+            previous = magnitude[:1] if self._previous is None else self._previous
+            difference = np.diff(magnitude, axis=0, prepend=previous)
+            out['flux'] = np.sqrt(np.einsum('ij,ij->i', difference, difference))
+            self._previous = magnitude[-1:].copy()
+        if 'peak_frequency' in self.features or 'peak_magnitude' in self.features:
+            peaks = np.argmax(magnitude, axis=1)
+            if 'peak_frequency' in self.features:
+                out['peak_frequency'] = peaks * self.samplerate / self.frame_size
+            if 'peak_magnitude' in self.features:
+                out['peak_magnitude'] = magnitude[np.arange(len(peaks)), peaks]
+
+def extract_features(signal, features=FEATURES, frame_size:int=2048, hop_size:int=1024, window:str='hanning', rolloff_percent:float=0.85) -> np.ndarray:
+    """Returns the per-frame features of an SvSignal as a structured array, see SvFeatureExtractor. The signal is read
+    once, block by block for streamed signals, and every frame is transformed once whatever features are requested."""
+    extractor = SvFeatureExtractor(signal.getSampleRate(), features, frame_size, hop_size, window, rolloff_percent)
+    out = extractor.empty(extractor.numFrames(signal.getNumFrames()))
+    for first_sample, data in signal._frameBlocks(frame_size, hop_size):
+        first_frame = first_sample // hop_size
+        extractor.process(data, first_frame, out[first_frame:first_frame + extractor.numFrames(len(data))])
+    return out
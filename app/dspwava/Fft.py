@@ -0,0 +1,143 @@
+import numpy as np
+import logging
+import os
+LOGGER = logging.getLogger(__name__)
+# names set_fft_backend accepts
+FFT_BACKENDS = ('scipy', 'fftw', 'numpy')
+
+class SvFftBackend:
+    """The FFT implementation every spectral path of the package goes through, see set_fft_backend.
+
+    The default uses scipy.fft. workers is the number of threads a transform may use, negative counts from
+    os.cpu_count() (-1 is every core). The threads split the independent rows of a batched transform (frames, STFT
+    segments, channels, convolution blocks), a single 1D transform always runs on one thread. scipy.fft keeps the plans
+    of recently used sizes, so the fixed-size transforms of framed and block-wise processing are planned once.
+    Real input keeps its precision, float32 transforms to complex64.
+    """
+    name = 'scipy'
+
+    def __init__(self, workers:int=1) -> None:
+        if workers == 0:
+            LOGGER.error('An FFT backend needs at least one worker')
+            raise ValueError('workers must be positive, or negative to count from the number of cores')
+        self.workers = workers if workers > 0 else max(1, (os.cpu_count() or 1) + 1 + workers)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(workers={self.workers})'
+
+    def rfft(self, x:np.ndarray, n:int=None, axis:int=-1, overwrite_x:bool=False) -> np.ndarray:
+        from scipy import fft
+        return fft.rfft(x, n=n, axis=axis, overwrite_x=overwrite_x, workers=self.workers)
+
+    def irfft(self, x:np.ndarray, n:int=None, axis:int=-1, overwrite_x:bool=False) -> np.ndarray:
+        from scipy import fft
+        return fft.irfft(x, n=n, axis=axis, overwrite_x=overwrite_x, workers=self.workers)
+
+    def fft(self, x:np.ndarray, n:int=None, axis:int=-1, overwrite_x:bool=False) -> np.ndarray:
+        from scipy import fft
+        return fft.fft(x, n=n, axis=axis, overwrite_x=overwrite_x, workers=self.workers)
+
+    def ifft(self, x:np.ndarray, n:int=None, axis:int=-1, overwrite_x:bool=False) -> np.ndarray:
+        from scipy import fft
+        return fft.ifft(x, n=n, axis=axis, overwrite_x=overwrite_x, workers=self.workers)
+
+    def next_fast_len(self, n:int, real:bool=True) -> int:
+        """returns the smallest transform size >= n that this backend transforms quickly"""
+        from scipy import fft
+        return fft.next_fast_len(n, real=real)
+
+class SvNumpyFft(SvFftBackend):
+    """numpy.fft, single threaded and without kept plans, to compare against results computed with numpy.fft"""
+    name = 'numpy'
+
+    def rfft(self, x, n=None, axis=-1, overwrite_x=False):
+        return np.fft.rfft(x, n=n, axis=axis)
+
+    def irfft(self, x, n=None, axis=-1, overwrite_x=False):
+        return np.fft.irfft(x, n=n, axis=axis)
+
+    def fft(self, x, n=None, axis=-1, overwrite_x=False):
+        return np.fft.fft(x, n=n, axis=axis)
+
+    def ifft(self, x, n=None, axis=-1, overwrite_x=False):
+        return np.fft.ifft(x, n=n, axis=axis)
+
+class SvFftwFft(SvFftBackend):
+    """FFTW through pyFFTW, which must be installed. Plans are made with planner_effort ('FFTW_ESTIMATE',
+    'FFTW_MEASURE', 'FFTW_PATIENT') the first time a shape and dtype is transformed and kept for keepalive seconds
+    after their last use, so measuring pays off on the repeated sizes of framed and block-wise processing.
+    Fast lengths include the factors 7, 11 and 13."""
+    name = 'fftw'
+
+    def __init__(self, workers:int=1, planner_effort:str='FFTW_MEASURE', keepalive:float=60.0) -> None:
+        super().__init__(workers)
+        try:
+            import pyfftw.interfaces.cache
+        except ImportError:
+            LOGGER.error('pyFFTW is not installed')
+            raise ValueError("The 'fftw' FFT backend needs pyFFTW (pip install pyfftw), use 'scipy' otherwise")
+        pyfftw.interfaces.cache.enable()
+        pyfftw.interfaces.cache.set_keepalive_time(keepalive)
+        self.planner_effort = planner_effort
+
+    def _call(self, transform:str, x, n, axis, overwrite_x):
+        from pyfftw.interfaces import scipy_fft
+        return getattr(scipy_fft, transform)(x, n=n, axis=axis, overwrite_x=overwrite_x, workers=self.workers,
+                                             planner_effort=self.planner_effort)
+
+    def rfft(self, x, n=None, axis=-1, overwrite_x=False):
+        return self._call('rfft', x, n, axis, overwrite_x)
+
+    def irfft(self, x, n=None, axis=-1, overwrite_x=False):
+        return self._call('irfft', x, n, axis, overwrite_x)
+
+    def fft(self, x, n=None, axis=-1, overwrite_x=False):
+        return self._call('fft', x, n, axis, overwrite_x)
+
+    def ifft(self, x, n=None, axis=-1, overwrite_x=False):
+        return self._call('ifft', x, n, axis, overwrite_x)
+
+    def next_fast_len(self, n, real=True):
+        import pyfftw
+        return pyfftw.next_fast_len(n)
+
+_BACKEND_TYPES = {'scipy': SvFftBackend, 'numpy': SvNumpyFft, 'fftw': SvFftwFft}
+# the backend every transform goes through
+_backend = SvFftBackend()
+
+def set_fft_backend(backend='scipy', workers:int=1, **options):
+    """Sets the FFT backend of every spectral path: an SvFftBackend, or one of FFT_BACKENDS created with workers and
+    options. The setting is per process, worker processes of a pool start with the default scipy backend on one thread."""
+    global _backend
+    if isinstance(backend, str):
+        if backend not in _BACKEND_TYPES:
+            LOGGER.error(f'Unknown FFT backend {backend!r}')
+            raise ValueError(f'Unknown FFT backend {backend!r}, use one of {FFT_BACKENDS}')
+        backend = _BACKEND_TYPES[backend](workers, **options)
+    _backend = backend
+    LOGGER.info(f'FFT backend set to {backend!r}')
+
+def get_fft_backend() -> SvFftBackend:
+    """returns the FFT backend in use"""
+    return _backend
+
+def rfft(x:np.ndarray, n:int=None, axis:int=-1, overwrite_x:bool=False) -> np.ndarray:
+    """real input FFT through the current backend"""
+    return _backend.rfft(x, n, axis, overwrite_x)
+
+def irfft(x:np.ndarray, n:int=None, axis:int=-1, overwrite_x:bool=False) -> np.ndarray:
+    """inverse of rfft through the current backend"""
+    return _backend.irfft(x, n, axis, overwrite_x)
+
+def fft(x:np.ndarray, n:int=None, axis:int=-1, overwrite_x:bool=False) -> np.ndarray:
+    """complex FFT through the current backend"""
+    return _backend.fft(x, n, axis, overwrite_x)
+
+def ifft(x:np.ndarray, n:int=None, axis:int=-1, overwrite_x:bool=False) -> np.ndarray:
+    """inverse of fft through the current backend"""
+    return _backend.ifft(x, n, axis, overwrite_x)
+
+def next_fast_len(n:int, real:bool=True) -> int:
+    """returns the smallest size >= n the current backend transforms quickly. Only pad to it where zero padding does not
+    change the result, as in linear convolution, not where the size sets the frequency bins."""
+    return _backend.next_fast_len(n, real)
@@ -0,0 +1,73 @@
+import numpy as np
+from functools import lru_cache
+from .Fft import rfft
+# roughly how many samples are transformed together, bounds the size of the 2D spectra
+BATCH_SAMPLES = 1 << 18
+
+@lru_cache(maxsize=64)
+def get_window(window, size:int, dtype:str='float64') -> np.ndarray:
+    """Returns a cached, read-only window of the given size and dtype. 'hanning' is numpy's symmetric hanning window,
+    anything else (a name or a tuple such as ('tukey', 0.25)) is passed to scipy.signal.get_window."""
+    if window == 'hanning':
+        win = np.hanning(size)
+    else:
+        from scipy import signal
+        win = signal.get_window(window, size)
+    win = win.astype(dtype)
+    win.setflags(write=False)
+    return win
+
+def frame_signal(data:np.ndarray, frame_size:int, hop_size:int) -> np.ndarray:
+    """Returns a strided, read-only view of the whole frames in data. No samples are copied.
+    Mono data gives shape (frames, frame_size), multichannel (samples, channels) data gives (frames, channels, frame_size)."""
+    if len(data) < frame_size:
+        return np.zeros((0,) + data.shape[1:] + (frame_size,), dtype=data.dtype)
+    return np.lib.stride_tricks.sliding_window_view(data, frame_size, axis=0)[::hop_size]
+
+def iter_frame_spectra(data:np.ndarray, frame_size:int, hop_size:int, window:str='hanning', batch_frames:int=None):
+    """Yields (first frame index, spectra) for batches of windowed frames of data, with one 2D rfft per batch.
+    Multichannel frames are averaged to mono before the transform. Batches hold about BATCH_SAMPLES samples by default."""
+    frames = frame_signal(data, frame_size, hop_size)
+    if batch_frames is None:
+        batch_frames = max(1, BATCH_SAMPLES // (frame_size * (data.shape[1] if data.ndim == 2 else 1)))
+    win = get_window(window, frame_size, np.result_type(data.dtype, np.float32).name)
+    for start in range(0, len(frames), batch_frames):
+        batch = frames[start:start + batch_frames]
+        if batch.ndim == 3:
+            batch = batch.mean(axis=1)
+        yield start, rfft(batch * win, axis=-1)
+
+def strongest_peak(data:np.ndarray, frame_size:int, hop_size:int, window:str='hanning') -> tuple[float, int]:
+    """Returns (magnitude, bin) of the strongest spectral peak over all the windowed frames of data, from the first frame
+    that reaches it. Multichannel frames are averaged to mono. Data without a whole frame gives (0, 0)."""
+    max_magnitude, max_bin = 0, 0
+    for _, spectra in iter_frame_spectra(data, frame_size, hop_size, window):
+        # Find the peak in the magnitude spectrum of every frame, keep the strongest
+        magnitude = np.abs(spectra)
+        peaks = np.argmax(magnitude, axis=1)
+        peak_magnitudes = magnitude[np.arange(len(peaks)), peaks]
+        frame = np.argmax(peak_magnitudes)
+        if peak_magnitudes[frame] > max_magnitude:
+            max_magnitude = peak_magnitudes[frame]
+            max_bin = peaks[frame]
+    return max_magnitude, max_bin
+
+def parabolic_peaks(magnitude:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Finds the peak bin of every row of a 2D magnitude spectrum and refines it by fitting a parabola through the
+    log magnitudes of the peak and its two neighbours. Returns (fractional peak bins, interpolated peak magnitudes).
+    https://ccrma.stanford.edu/~jos/sasp/Sinusoidal_Peak_Interpolation.html"""
+    rows = np.arange(len(magnitude))
+    peak = np.argmax(magnitude, axis=-1)
+    inner = np.clip(peak, 1, magnitude.shape[-1] - 2)
+    tiny = np.finfo(magnitude.dtype).tiny
+    alpha = np.log(magnitude[rows, inner - 1] + tiny)
+    beta = np.log(magnitude[rows, inner] + tiny)
+    gamma = np.log(magnitude[rows, inner + 1] + tiny)
+    curvature = alpha - 2 * beta + gamma
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.where(curvature < 0, 0.5 * (alpha - gamma) / curvature, 0.0)
+    # peaks on the first or last bin have only one neighbour and are not interpolated
+    offset = np.where(peak == inner, offset, 0.0)
+    height = np.exp(beta - 0.25 * (alpha - gamma) * offset)
+    height = np.where(peak == inner, height, magnitude[rows, peak])
+    return peak + offset, height
@@ -0,0 +1,290 @@
+import numpy as np
+import logging
+import multiprocessing
+import os
+import concurrent.futures
+from contextlib import ExitStack
+from multiprocessing import shared_memory
+from .Signal import SvSignal
+from .Stft import SvStft
+from .Frames import strongest_peak
+from .ExtraFilters import SvFilter, filtfilt_padlen, scaled_zi
+from .Convolver import SvConvolver, choose_blocksize
+from .DiskCache import derived
+LOGGER = logging.getLogger(__name__)
+# shortest segment worth sending to a worker, in samples
+MIN_SEGMENT = 1 << 16
+# filter segments start this far into the decay of the impulse response, relative to its peak
+WARMUP_TOLERANCE = 1e-12
+
+class SvSharedArray:
+    """An array in a multiprocessing.shared_memory block. Workers attach to it by name from descriptor(), so the samples
+    are never pickled. The creator owns the block: close() releases and unlinks it."""
+    def __init__(self, shape:tuple, dtype) -> None:
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(self.shape)) * self.dtype.itemsize))
+        self.array = np.ndarray(self.shape, self.dtype, buffer=self.shm.buf)
+
+    def descriptor(self) -> tuple:
+        return self.shm.name, self.shape, self.dtype.str
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        self.shm.unlink()
+
+def _run(task, descriptors:tuple, *args):
+    """worker side: attaches the shared arrays, runs task on them and detaches. Results must not be views of them."""
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in descriptors]
+    try:
+        arrays = [np.ndarray(shape, dtype, buffer=shm.buf) for shm, (_, shape, dtype) in zip(blocks, descriptors)]
+        result = task(*arrays, *args)
+        del arrays
+        return result
+    finally:
+        for shm in blocks:
+            try:
+                shm.close()
+            except BufferError:
+                # a view is still referenced from a traceback, the map goes when it is collected
+                pass
+
+def _warm():
+    """worker initializer, pays the imports once per process"""
+    import scipy.signal, scipy.fft
+
+def split_range(total:int, parts:int, min_size:int=1) -> list:
+    """Splits range(total) into at most parts contiguous (start, stop) pieces of nearly equal length, none shorter than
+    min_size unless total is"""
+    parts = max(1, min(parts, total // max(1, min_size)))
+    bounds = np.linspace(0, total, parts + 1).round().astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:])]
+
+# tasks, run on (start, stop) segments of the shared arrays
+
+def _peak_task(data, start, stop, frame_size, hop_size):
+    return strongest_peak(data[start:stop], frame_size, hop_size)
+
+def _stft_task(data, out, first, last, samplerate, nperseg, noverlap, nfft, window, scaling):
+    stft = SvStft(samplerate, nperseg, noverlap, nfft, window, scaling)
+    column = first
+    for _, power in stft.stream([data[first * stft.step:(last - 1) * stft.step + nperseg]]):
+        out[..., column:column + power.shape[-1]] = power
+        column += power.shape[-1]
+
+def _filtfilt(sos:np.ndarray, x:np.ndarray, pad_start:bool, pad_end:bool, padlen:int) -> np.ndarray:
+    """forward-backward filter of a piece of a signal. Ends of the signal are extended and started in steady state as
+    scipy.signal.sosfiltfilt does, other ends start from rest and rely on the warm-up samples around the piece."""
+    from scipy.signal import sosfilt, sosfilt_zi
+    zi = sosfilt_zi(sos)
+    sections = sos.astype(x.dtype) if x.dtype == np.float32 else sos
+    if pad_start:
+        x = np.concatenate((2 * x[0] - x[padlen:0:-1], x))
+    if pad_end:
+        x = np.concatenate((x, 2 * x[-1] - x[-2:-padlen - 2:-1]))
+    y = sosfilt(sections, x, axis=0, zi=scaled_zi(zi, x[0]).astype(sections.dtype))[0] if pad_start else sosfilt(sections, x, axis=0)
+    y = y[::-1]
+    y = sosfilt(sections, y, axis=0, zi=scaled_zi(zi, y[0]).astype(sections.dtype))[0] if pad_end else sosfilt(sections, y, axis=0)
+    y = y[::-1]
+    return y[padlen if pad_start else 0:len(y) - (padlen if pad_end else 0)]
+
+def _filter_task(data, out, start, stop, sos, warmup, zero_phase, padlen):
+    from scipy.signal import sosfilt
+    lo = max(0, start - warmup)
+    if zero_phase:
+        hi = min(len(data), stop + warmup)
+        y = _filtfilt(sos, data[lo:hi], lo == 0, hi == len(data), padlen)
+    else:
+        y = sosfilt(sos.astype(data.dtype) if data.dtype == np.float32 else sos, data[lo:stop], axis=0)
+    out[start:stop] = y[start - lo:stop - lo]
+
+def _convolve_task(data, impulse, out, start, stop, blocksize):
+    # output samples start..stop depend on the input from start - len(impulse) + 1 to stop
+    first = max(0, start - len(impulse) + 1)
+    y = SvConvolver(impulse, blocksize, data.dtype).convolve(data[first:min(len(data), stop)])
+    out[start:stop] = y[start - first:stop - first]
+
+class SvParallel:
+    """Parallel analysis of a single long signal on a pool of worker processes.
+
+    The samples are copied once into shared memory (streamed signals are decoded straight into it) and the work is split
+    into segments, one per worker by default, that the workers read in place; results are written into a shared output
+    array or reduced, never pickled. Segments overlap where the operation needs context:
+
+        estimate_frequency  segments hold whole frames, the strongest peak of each is reduced. Same result as the method.
+        getSpectrogram      segments hold whole STFT segments, overlapping by noverlap. Same result as the method.
+        high/low_pass_filter each segment is filtered with a warm-up of the filter's impulse response length (to
+                            WARMUP_TOLERANCE of its peak) on the sides the filter runs in from, the ends of the signal are
+                            padded as in the serial filter. Matches it to about WARMUP_TOLERANCE of the signal peak.
+        convolve_audio      every output segment reads its input plus the impulse response length before it
+                            (overlap-save), so there are no tails to add up. Matches it to rounding.
+
+    Signals too short for two segments of MIN_SEGMENT samples run in this process. The pool starts with the first
+    parallel call and is kept until close(), after which parallel calls raise a ValueError. The filters run when called,
+    also on signals that defer derived operations (see DiskCache.derived). Use the executor as a context manager:
+
+        with SvParallel(workers=8) as parallel:
+            f, t, spect = parallel.getSpectrogram(signal, nperseg=1024)
+            parallel.high_pass_filter(signal, 80)
+    """
+    def __init__(self, workers:int=None, segments:int=None, min_segment:int=MIN_SEGMENT) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.segments = segments or self.workers
+        self.min_segment = min_segment
+        self.pool = None
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Stops the workers. The executor cannot be used for parallel calls afterwards."""
+        self.closed = True
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def _getPool(self):
+        if self.closed:
+            LOGGER.error('SvParallel used after close()')
+            raise ValueError('This SvParallel is closed, create a new one')
+        if self.pool is None:
+            # forked workers would inherit whatever the caller has open, start them clean
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.workers, multiprocessing.get_context(method), _warm)
+        return self.pool
+
+    def _split(self, total:int, min_size:int) -> list:
+        return split_range(total, self.segments, max(min_size, 1))
+
+    def _map(self, task, arrays:list, jobs:list) -> list:
+        """Runs task(*arrays, *job) for every job. A single job runs here, several are sent to the pool: arrays are copied
+        into shared memory and writable ones copied back, SvSharedArrays are passed as they are. Closes the SvSharedArrays."""
+        with ExitStack() as stack:
+            shared = []
+            for array in arrays:
+                if not isinstance(array, SvSharedArray):
+                    if len(jobs) == 1:
+                        shared.append(array)
+                        continue
+                    block = SvSharedArray(array.shape, array.dtype)
+                    block.array[...] = array
+                    array = block
+                stack.callback(array.close)
+                shared.append(array)
+            if len(jobs) == 1:
+                return [task(*[a.array if isinstance(a, SvSharedArray) else a for a in shared], *jobs[0])]
+            descriptors = tuple(block.descriptor() for block in shared)
+            futures = [self._getPool().submit(_run, task, descriptors, *job) for job in jobs]
+            results = [future.result() for future in futures]
+            for array, block in zip(arrays, shared):
+                if isinstance(array, np.ndarray) and array.flags.writeable:
+                    array[...] = block.array
+        return results
+
+    def _samples(self, signal:SvSignal, parallel:bool):
+        """The samples to work on. Streamed signals going to the pool are decoded block by block straight into shared
+        memory, other signals give their samples, read-only."""
+        signal.validDataCheck()
+        if parallel and signal.isStreaming():
+            frames = signal.getNumFrames()
+            block = SvSharedArray((frames,) if signal.getNumChannels() == 1 else (frames, signal.getNumChannels()), signal.getDtype())
+            position = 0
+            for samples in signal.blocks():
+                block.array[position:position + len(samples)] = samples
+                position += len(samples)
+            return block
+        data = signal.getSamples().view()
+        data.flags.writeable = False
+        return data
+
+    def estimate_frequency(self, signal:SvSignal, frame_size:int=2048, hop_size:int=1024) -> float:
+        """SvSignal.estimate_frequency over segments of whole frames"""
+        signal.validDataCheck()
+        samples = signal.getNumFrames()
+        frames = 0 if samples < frame_size else 1 + (samples - frame_size) // hop_size
+        jobs = [(first * hop_size, (last - 1) * hop_size + frame_size, frame_size, hop_size)
+                for first, last in self._split(frames, self.min_segment // hop_size) if last > first]
+        if not jobs:
+            return 0
+        data = self._samples(signal, len(jobs) > 1)
+        max_magnitude, max_bin = 0, 0
+        # in signal order, so ties go to the first frame as in the serial method
+        for magnitude, peak in self._map(_peak_task, [data], jobs):
+            if magnitude > max_magnitude:
+                max_magnitude, max_bin = magnitude, peak
+        return max_bin * signal.getSampleRate() / frame_size
+
+    def getSpectrogram(self, signal:SvSignal, nperseg=256, noverlap=None, nfft=None, window='hann', scaling='density') -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """SvSignal.getSpectrogram over segments of whole STFT segments, returns (f, t, spectrogram)"""
+        signal.validDataCheck()
+        samples = signal.getNumFrames()
+        nperseg = min(nperseg, samples)
+        stft = SvStft(signal.getSampleRate(), nperseg, noverlap, nfft, window, scaling)
+        count = 0 if samples < nperseg else 1 + (samples - nperseg) // stft.step
+        channels = signal.getNumChannels()
+        if count == 0:
+            t, spect = stft.empty(channels)
+            return stft.frequencies, t, spect
+        jobs = [(first, last, signal.getSampleRate(), nperseg, noverlap, nfft, window, scaling)
+                for first, last in self._split(count, self.min_segment // stft.step)]
+        shape = (len(stft.frequencies), count) if channels == 1 else (channels, len(stft.frequencies), count)
+        out = np.empty(shape, dtype=np.result_type(signal.getDtype(), np.float32))
+        self._map(_stft_task, [self._samples(signal, len(jobs) > 1), out], jobs)
+        t = (np.arange(count) * stft.step + nperseg / 2) / signal.getSampleRate()
+        return stft.frequencies, t, out
+
+    @derived(defer=False)
+    def high_pass_filter(self, signal:SvSignal, cutoff_freq, order=5, zero_phase:bool=True) -> SvSignal:
+        """ExtraFilters.high_pass_filter over segments with filter warm-up. Modifies the signal in place."""
+        return self._butterworth(signal, 'high', cutoff_freq, order, zero_phase)
+
+    @derived(defer=False)
+    def low_pass_filter(self, signal:SvSignal, cutoff_freq, order=5, zero_phase:bool=True) -> SvSignal:
+        """ExtraFilters.low_pass_filter over segments with filter warm-up. Modifies the signal in place."""
+        return self._butterworth(signal, 'low', cutoff_freq, order, zero_phase)
+
+    def _butterworth(self, signal:SvSignal, btype:str, cutoff_freq, order, zero_phase:bool) -> SvSignal:
+        signal.validDataCheck()
+        samples = signal.getNumFrames()
+        filt = SvFilter(btype, cutoff_freq, signal.getSampleRate(), order)
+        padlen = filtfilt_padlen(filt.sos)
+        if zero_phase and samples <= padlen:
+            raise ValueError(f"The signal must be longer than {padlen} samples for zero-phase filtering")
+        warmup = filt.decayLength(samples, WARMUP_TOLERANCE)
+        # segments at least a few warm-ups long, or the overlap costs more than the parallelism gains
+        jobs = [(start, stop, filt.sos, warmup, zero_phase, padlen) for start, stop in self._split(samples, max(self.min_segment, 4 * warmup))]
+        channels = signal.getNumChannels()
+        out = np.empty((samples,) if channels == 1 else (samples, channels), dtype=signal.getDtype())
+        self._map(_filter_task, [self._samples(signal, len(jobs) > 1), out], jobs)
+        if signal.isStreaming():
+            signal.data = out
+        else:
+            signal.getWritableData()[...] = out
+            signal.touch()
+        return signal
+
+    def convolve_audio(self, sample_signal:SvSignal, impulse_signal:SvSignal, normalize:bool=False, blocksize:int=None) -> SvSignal:
+        """ExtraFilters.convolve_audio over output segments that each read the impulse response length of input before them"""
+        sample_signal.validDataCheck()
+        if sample_signal.getSampleRate() != impulse_signal.getSampleRate():
+            raise ValueError("Sample rates of audio and impulse response do not match.")
+        dtype = sample_signal.getDtype()
+        impulse = np.asarray(impulse_signal.getSamples(), dtype=dtype)
+        if len(impulse) == 0:
+            raise ValueError("Impulse response is empty")
+        blocksize = choose_blocksize(len(impulse)) if blocksize is None else blocksize
+        samples = sample_signal.getNumFrames()
+        length = samples + len(impulse) - 1 if samples else 0
+        channels = max(sample_signal.getNumChannels(), 1 if impulse.ndim == 1 else impulse.shape[1])
+        out = np.empty((length,) if channels == 1 else (length, channels), dtype=np.result_type(dtype, np.float32))
+        jobs = [(start, stop, blocksize) for start, stop in self._split(length, max(self.min_segment, 4 * len(impulse)))]
+        self._map(_convolve_task, [self._samples(sample_signal, len(jobs) > 1), impulse, out], jobs)
+        signal = SvSignal(data=out, sr=sample_signal.getSampleRate(), channels=1 if out.ndim == 1 else out.shape[1])
+        if normalize:
+            signal.normalize()
+        return signal
@@ -0,0 +1,298 @@
+import numpy as np
+import logging
+from .Signal import SvSignal
+from .ExtraFilters import SvFilter, filtfilt_padlen, scaled_zi
+from .Resampler import SvResampler, rate_ratio, resampled_length
+LOGGER = logging.getLogger(__name__)
+
+class _Mono:
+    def process(self, block):
+        return block.mean(axis=1) if block.ndim == 2 else block
+
+class _Gain:
+    def __init__(self, gain):
+        self.gain = gain
+    def process(self, block):
+        return block * np.asarray(self.gain, dtype=block.dtype)
+
+class _PendingGain:
+    """Applies the normalization gain collected by earlier passes, before an operation that does not commute with it"""
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+    def start(self):
+        self.gain, self.pipeline._pending_gain = self.pipeline._pending_gain, 1.0
+    def process(self, block):
+        return block * np.asarray(self.gain, dtype=block.dtype)
+
+class _Peak:
+    """Streaming reduction for peak normalization: records the per-channel peak of the blocks passing this point"""
+    def __init__(self, target_amplitude):
+        self.target_amplitude = target_amplitude
+        self.peak = 0.0
+        # set once the pass holding this reduction has seen all the data
+        self.done = False
+        self.resolved = False
+    def process(self, block):
+        if len(block):
+            self.peak = np.maximum(self.peak, np.max(np.abs(block), axis=0))
+        return block
+
+class _Causal:
+    def __init__(self, filt:SvFilter):
+        self.filt = filt
+    def process(self, block):
+        return self.filt.process(block)
+
+class _Resample:
+    def __init__(self, resampler:SvResampler):
+        self.resampler = resampler
+    def process(self, block):
+        return self.resampler.process(block)
+    def flush(self):
+        return self.resampler.flush()
+
+class _ZeroPhase:
+    """State shared by the forward and backward halves of a zero-phase filter. Reproduces scipy.signal.sosfiltfilt:
+    odd extension of padlen samples at both ends, steady state initial conditions, forward pass, then backward pass."""
+    def __init__(self, filt:SvFilter):
+        from scipy.signal import sosfilt_zi
+        self.filt = filt
+        self.padlen = filtfilt_padlen(filt.sos)
+        self.zi = sosfilt_zi(filt.sos)
+        self.post = None
+
+class _ZeroPhaseForward:
+    def __init__(self, state:_ZeroPhase):
+        self.state = state
+        self.z = None
+        self.head = []
+        self.tail = None
+    def _start(self, x):
+        from scipy.signal import sosfilt
+        P = self.state.padlen
+        if len(x) <= P:
+            raise ValueError(f"The signal must be longer than {P} samples for zero-phase filtering")
+        pre = 2 * x[0] - x[P:0:-1]
+        self.sos = self.state.filt.getSections(x)
+        _, self.z = sosfilt(self.sos, pre, axis=0, zi=scaled_zi(self.state.zi, pre[0]).astype(self.sos.dtype))
+    def _filter(self, block):
+        from scipy.signal import sosfilt
+        P = self.state.padlen
+        # the last padlen + 1 samples make up the odd extension at the end. Copied, in place passes overwrite the block.
+        self.tail = block[-(P + 1):].copy() if self.tail is None or len(block) > P else np.concatenate((self.tail, block))[-(P + 1):]
+        y, self.z = sosfilt(self.sos, block, axis=0, zi=self.z)
+        return y
+    def process(self, block):
+        if self.z is None:
+            # the odd extension at the start needs the first padlen + 1 samples
+            self.head.append(block)
+            if sum(len(b) for b in self.head) <= self.state.padlen:
+                return block[:0]
+            block = np.concatenate(self.head)
+            self.head = None
+            self._start(block)
+        return self._filter(block)
+    def flush(self):
+        from scipy.signal import sosfilt
+        out = None
+        if self.z is None:
+            block = np.concatenate(self.head)
+            self.head = None
+            self._start(block)
+            out = self._filter(block)
+        x = self.tail
+        post = 2 * x[-1] - x[-2::-1][:self.state.padlen]
+        self.state.post, _ = sosfilt(self.sos, post, axis=0, zi=self.z)
+        return out
+
+class _ZeroPhaseBackward:
+    def __init__(self, state:_ZeroPhase):
+        self.state = state
+    def start(self):
+        from scipy.signal import sosfilt
+        post = self.state.post[::-1]
+        self.sos = self.state.filt.getSections(post)
+        _, self.z = sosfilt(self.sos, post, axis=0, zi=scaled_zi(self.state.zi, post[0]).astype(self.sos.dtype))
+    def process(self, reversed_block):
+        from scipy.signal import sosfilt
+        y, self.z = sosfilt(self.sos, reversed_block, axis=0, zi=self.z)
+        return y
+
+class _Pass:
+    def __init__(self, direction:str, shape:tuple, reshapes:bool=False):
+        self.direction = direction
+        # (frames, channels) of the data after this pass
+        self.shape = shape
+        # whether the pass changes the length or channel count, in which case it cannot write in place
+        self.reshapes = reshapes
+        self.ops = []
+
+class SvPipeline:
+    """Deferred chain of SvSignal operations executed block by block.
+
+    Operations are only recorded until run() is called. They are then fused into as few passes over the data as possible:
+    every source block goes through all the elementwise and streaming steps (mixdown, gains, causal filters, resampling,
+    the forward half of zero-phase filters) before the next block is read, and the result is written into a single output
+    buffer. A zero-phase filter adds one backward pass over that buffer, in place. Peak normalization is a streaming
+    reduction: the peak is measured as blocks go by and the gain is applied to the output at the end, which is valid because
+    everything after it is linear. No full-size intermediate arrays are created.
+
+        result = signal.pipeline().toMono().high_pass_filter(1000).low_pass_filter(200).normalize().run()
+    """
+    def __init__(self, signal:SvSignal) -> None:
+        signal.validDataCheck()
+        self.signal = signal
+        self.steps = []
+
+    def toMono(self):
+        self.steps.append(('mono',))
+        return self
+
+    def gain(self, factor):
+        self.steps.append(('gain', factor))
+        return self
+
+    def normalize(self, target_amplitude=1.0):
+        self.steps.append(('normalize', target_amplitude))
+        return self
+
+    def high_pass_filter(self, cutoff_freq, order=5, zero_phase:bool=True):
+        self.steps.append(('filter', 'high', cutoff_freq, order, zero_phase))
+        return self
+
+    def low_pass_filter(self, cutoff_freq, order=5, zero_phase:bool=True):
+        self.steps.append(('filter', 'low', cutoff_freq, order, zero_phase))
+        return self
+
+    def resample(self, new_samplerate):
+        self.steps.append(('resample', new_samplerate))
+        return self
+
+    def _plan(self):
+        """Groups the steps into passes. Returns (passes, peak reductions, frames, channels, samplerate) of the result."""
+        frames, channels, samplerate = self.signal.getNumFrames(), self.signal.getNumChannels(), self.signal.getSampleRate()
+        passes = [_Pass('forward', (frames, channels))]
+        peaks = []
+        for step in self.steps:
+            current = passes[-1]
+            kind = step[0]
+            if kind == 'gain':
+                current.ops.append(_Gain(step[1]))
+            elif kind == 'normalize':
+                peak = _Peak(step[1])
+                peaks.append(peak)
+                current.ops.append(peak)
+            elif kind in ('mono', 'resample'):
+                if kind == 'mono' and channels == 1:
+                    continue
+                measuring = any(isinstance(op, _Peak) for op in current.ops)
+                if current is not passes[0] or (kind == 'mono' and measuring):
+                    current = _Pass('forward', (frames, channels), reshapes=True)
+                    passes.append(current)
+                if peaks and kind == 'mono':
+                    # per-channel normalization gains do not commute with the mixdown, apply them first
+                    current.ops.append(_PendingGain(self))
+                current.reshapes = True
+                if kind == 'mono':
+                    current.ops.append(_Mono())
+                    channels = 1
+                else:
+                    current.ops.append(_Resample(SvResampler(samplerate, step[1], self.signal.getDtype())))
+                    up, down = rate_ratio(samplerate, step[1])
+                    frames, samplerate = resampled_length(frames, up, down), step[1]
+            elif kind == 'filter':
+                _, btype, cutoff_freq, order, zero_phase = step
+                filt = SvFilter(btype, cutoff_freq, samplerate, order)
+                if current.direction != 'forward':
+                    current = _Pass('forward', (frames, channels))
+                    passes.append(current)
+                if zero_phase:
+                    state = _ZeroPhase(filt)
+                    current.ops.append(_ZeroPhaseForward(state))
+                    backward = _Pass('backward', (frames, channels))
+                    backward.ops.append(_ZeroPhaseBackward(state))
+                    passes.append(backward)
+                else:
+                    current.ops.append(_Causal(filt))
+            passes[-1].shape = (frames, channels)
+        return passes, peaks, frames, channels, samplerate
+
+    def _resolveGains(self, peaks:list):
+        """Turns the peaks measured so far into the pending normalization gain, in step order"""
+        for peak in peaks:
+            if not peak.done:
+                break
+            if peak.resolved:
+                continue
+            # earlier gains not yet applied to the stream scale this peak too
+            true_peak = self._pending_gain * peak.peak
+            silent = np.asarray(true_peak) == 0
+            gain = np.where(silent, 1.0, peak.target_amplitude / np.where(silent, 1.0, true_peak))
+            self._pending_gain = self._pending_gain * gain
+            peak.resolved = True
+
+    def _runOps(self, ops:list, block:np.ndarray, first:int=0) -> np.ndarray:
+        for op in ops[first:]:
+            block = op.process(block)
+        return block
+
+    def run(self, inplace:bool=False) -> SvSignal:
+        """Executes the pipeline and returns the result as a new SvSignal, or stores it in the source signal if inplace.
+        In place, an in memory signal whose shape does not change is processed over its own samples, with no new array."""
+        passes, peaks, frames, channels, samplerate = self._plan()
+        self._pending_gain = 1.0
+        blocksize = self.signal.blocksize
+        out = None
+        for p in passes:
+            for op in p.ops:
+                if hasattr(op, 'start'):
+                    op.start()
+            if p.direction == 'forward':
+                if out is None and inplace and not p.reshapes and not self.signal.isStreaming() and self.signal.data.dtype == self.signal.getDtype():
+                    # the first pass reads each block before writing its output over it
+                    out = self.signal.getWritableData()
+                if out is None:
+                    source = self.signal.blocks()
+                else:
+                    source = (out[i:i + blocksize] for i in range(0, len(out), blocksize))
+                if out is None or p.reshapes:
+                    # the only full-size allocation of the pass, shaped like its result
+                    out_frames, out_channels = p.shape
+                    target = np.empty((out_frames,) if out_channels == 1 else (out_frames, out_channels), dtype=self.signal.getDtype())
+                else:
+                    target = out
+                position = 0
+                for block in source:
+                    y = self._runOps(p.ops, block)
+                    target[position:position + len(y)] = y
+                    position += len(y)
+                for i, op in enumerate(p.ops):
+                    if hasattr(op, 'flush'):
+                        tail = op.flush()
+                        if tail is not None and len(tail):
+                            y = self._runOps(p.ops, tail, i + 1)
+                            target[position:position + len(y)] = y
+                            position += len(y)
+                if position != len(target):
+                    raise RuntimeError(f'Pipeline produced {position} frames, expected {len(target)}')
+                out = target
+            else:
+                for end in range(len(out), 0, -blocksize):
+                    start = max(0, end - blocksize)
+                    out[start:end] = self._runOps(p.ops, out[start:end][::-1])[::-1]
+            for op in p.ops:
+                if isinstance(op, _Peak):
+                    op.done = True
+            self._resolveGains(peaks)
+        if np.any(np.asarray(self._pending_gain) != 1.0):
+            out *= self._pending_gain
+        if inplace:
+            # out replaces the samples, so a streamed or not yet decoded signal drops its source without decoding it
+            self.signal._source, self.signal._ops, self.signal._lazy = None, [], False
+            self.signal.data = out
+            self.signal.samplerate = samplerate
+            self.signal.channels = channels
+            return self.signal
+        result = SvSignal(data=out, sr=samplerate, channels=channels, blocksize=blocksize, dtype=self.signal.getDtype())
+        result.filepath, result.fp_name = self.signal.filepath, self.signal.fp_name
+        return result
@@ -0,0 +1,201 @@
+import csv
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import numpy as np
+LOGGER = logging.getLogger(__name__)
+# accessors that are too cheap and too frequent to be worth a record
+UNPROFILED = frozenset({'validDataCheck', 'touch', 'isStreaming', 'getSampleRate', 'getNumFrames', 'getNumChannels', 'getDuration',
+                        'getDtype', 'getSamples', 'getRawSamples', 'getDataVersion', 'getCache', 'getCacheStats', 'setCacheBudget',
+                        'getWritableData', 'pipeline'})
+# the profiler collecting records, None when profiling is off
+_active = None
+_lock = threading.Lock()
+
+def _describe(value):
+    """a short JSON friendly description of a parameter value"""
+    if isinstance(value, np.ndarray):
+        return f'array{value.shape} {value.dtype}'
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if type(value).__name__ == 'SvSignal':
+        return value.fp_name or 'SvSignal'
+    return repr(value)[:80]
+
+def _signal_size(signal) -> tuple:
+    """(file name, samples) of an SvSignal, read from its attributes so no profiled method is called"""
+    try:
+        frames = signal._source.frames if signal._data is None and signal._source is not None else len(signal._data)
+        return signal.fp_name, frames * (signal.channels or 1)
+    except Exception:
+        return getattr(signal, 'fp_name', None), 0
+
+class SvProfiler:
+    """Collects the wall time, samples processed and memory allocated by every profiled SvSignal method and
+    ExtraFilters function called while it is active.
+
+    Profiling is opt-in and scoped: use the profiler as a context manager, or call start() and stop(). Calls made
+    while no profiler is active cost one global lookup. Each record holds the operation, the file name (fp_name) of
+    the signal, the parameters, the nesting depth (0 for calls made by user code), seconds, samples, samples per
+    second and, with memory=True, the peak bytes allocated during the call as traced by tracemalloc.
+    tracemalloc slows allocation heavy code down, so compare timings with memory=False. The first call of an
+    operation includes the lazy import of scipy.
+
+        with SvProfiler() as profiler:
+            high_pass_filter(signal, 80)
+            signal.normalize()
+        profiler.toJson('profile.json')
+    """
+    def __init__(self, memory:bool=True) -> None:
+        self.memory = memory
+        self.records = []
+        self._started_tracemalloc = False
+        self._local = threading.local()
+
+    def start(self):
+        """Makes this the active profiler"""
+        global _active
+        with _lock:
+            if _active is not None and _active is not self:
+                raise ValueError('Another profiler is already active')
+            _active = self
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        return self
+
+    def stop(self):
+        """Stops collecting records"""
+        global _active
+        with _lock:
+            if _active is self:
+                _active = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def call(self, name:str, func, signature, args, kwargs):
+        """Runs func and records it"""
+        stack = self._stack()
+        bound = signature.bind_partial(*args, **kwargs)
+        signal = next((a for a in bound.arguments.values() if type(a).__name__ == 'SvSignal'), None)
+        fp_name, samples = _signal_size(signal) if signal is not None else (None, 0)
+        params = {k: _describe(v) for k, v in bound.arguments.items() if v is not signal}
+        frame = {'peak': 0, 'start_memory': 0}
+        memory = self.memory and tracemalloc.is_tracing()
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # the peak so far belongs to the caller, keep it before the child resets it
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['start_memory'] = current
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            allocated = None
+            if memory:
+                frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                allocated = frame['peak'] - frame['start_memory']
+                if stack:
+                    stack[-1]['peak'] = max(stack[-1]['peak'], frame['peak'])
+            self.records.append({'operation': name, 'file': fp_name, 'depth': len(stack), 'seconds': seconds, 'samples': samples,
+                                 'samples_per_s': samples / seconds if seconds > 0 else 0.0, 'allocated_bytes': allocated,
+                                 'params': params})
+
+    def extend(self, records:list):
+        """Adds records collected elsewhere, for example by the worker processes of a batch"""
+        self.records.extend(records)
+
+    def clear(self):
+        self.records = []
+
+    def summary(self, key:str='operation', top_level:bool=False) -> dict:
+        """Aggregates the records by 'operation' or 'file': calls, total/mean/max seconds, samples, throughput and the
+        largest allocation. top_level only counts calls made by user code, so nested calls are not counted twice."""
+        groups = {}
+        for record in self.records:
+            if top_level and record['depth']:
+                continue
+            group = groups.setdefault(record[key], {'calls': 0, 'total_s': 0.0, 'max_s': 0.0, 'samples': 0, 'max_allocated_bytes': 0})
+            group['calls'] += 1
+            group['total_s'] += record['seconds']
+            group['max_s'] = max(group['max_s'], record['seconds'])
+            group['samples'] += record['samples']
+            group['max_allocated_bytes'] = max(group['max_allocated_bytes'], record['allocated_bytes'] or 0)
+        for group in groups.values():
+            group['mean_s'] = group['total_s'] / group['calls']
+            group['samples_per_s'] = group['samples'] / group['total_s'] if group['total_s'] > 0 else 0.0
+        return dict(sorted(groups.items(), key=lambda item: -item[1]['total_s']))
+
+    def toJson(self, path:str):
+        """Writes the records and the per operation and per file summaries as JSON"""
+        with open(path, 'w') as f:
+            json.dump({'records': self.records, 'by_operation': self.summary('operation'),
+                       'by_file': self.summary('file', top_level=True)}, f, indent=2, default=str)
+        LOGGER.info(f'Profile written to {path}')
+
+    def toCsv(self, path:str):
+        """Writes one row per record, parameters as a JSON column"""
+        columns = ['operation', 'file', 'depth', 'seconds', 'samples', 'samples_per_s', 'allocated_bytes', 'params']
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for record in self.records:
+                writer.writerow([json.dumps(record[c], default=str) if c == 'params' else record[c] for c in columns])
+        LOGGER.info(f'Profile written to {path}')
+
+    def save(self, path:str):
+        """Writes CSV for .csv paths, JSON otherwise"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        (self.toCsv if path.endswith('.csv') else self.toJson)(path)
+
+def get_active_profiler():
+    """returns the active SvProfiler, or None"""
+    return _active
+
+def profiled(func, name:str=None):
+    """Wraps a function so that calls are recorded by the active SvProfiler. Without one the call goes straight through."""
+    name = name or func.__qualname__
+    signature = inspect.signature(func)
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _active
+        if profiler is None:
+            return func(*args, **kwargs)
+        return profiler.call(name, func, signature, args, kwargs)
+    wrapper.__profiled__ = True
+    return wrapper
+
+def instrument_class(cls):
+    """Wraps every public method of cls with profiled, except cheap accessors and generators"""
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith('_') or attr in UNPROFILED or not inspect.isfunction(value) or inspect.isgeneratorfunction(value):
+            continue
+        setattr(cls, attr, profiled(value, f'{cls.__name__}.{attr}'))
+    return cls
+
+def instrument_module(namespace:dict, names):
+    """Wraps the named functions of a module namespace with profiled"""
+    for attr in names:
+        namespace[attr] = profiled(namespace[attr], attr)
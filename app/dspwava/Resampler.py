@@ -0,0 +1,121 @@
+import numpy as np
+import logging
+from fractions import Fraction
+from functools import lru_cache
+LOGGER = logging.getLogger(__name__)
+# Kaiser window beta of the anti-aliasing filter, same default as scipy.signal.resample_poly
+KAISER_BETA = 5.0
+# largest up/down factor considered when approximating a non-integer rate ratio
+MAX_DENOMINATOR = 1000
+
+def rate_ratio(old_samplerate, new_samplerate) -> tuple[int, int]:
+    """returns the reduced (up, down) factors that take old_samplerate to new_samplerate, e.g. 44100 -> 48000 gives (160, 147)"""
+    ratio = Fraction(new_samplerate).limit_denominator(MAX_DENOMINATOR) / Fraction(old_samplerate).limit_denominator(MAX_DENOMINATOR)
+    ratio = ratio.limit_denominator(MAX_DENOMINATOR)
+    return ratio.numerator, ratio.denominator
+
+@lru_cache(maxsize=32)
+def get_filter_bank(up:int, down:int, dtype:str='float64') -> tuple[np.ndarray, int]:
+    """Returns (h, delay) for an up/down ratio: the windowed-sinc low pass filter applied by the polyphase resampler,
+    zero padded so the output samples are centred, and the number of leading output samples that only hold filter delay.
+    Filters are designed once per ratio and dtype and returned read-only."""
+    from scipy.signal import firwin
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = firwin(2 * half_len + 1, 1.0 / max_rate, window=('kaiser', KAISER_BETA)) * up
+    pre_pad = down - half_len % down
+    h = np.concatenate((np.zeros(pre_pad), h)).astype(dtype)
+    h.setflags(write=False)
+    return h, (half_len + pre_pad) // down
+
+def resampled_length(frames:int, up:int, down:int) -> int:
+    """returns the number of output frames for frames input frames, ceil(frames * up / down)"""
+    return -(-frames * up // down)
+
+def resample_array(data:np.ndarray, old_samplerate, new_samplerate) -> np.ndarray:
+    """Resamples mono or (frames, channels) data with rational polyphase filtering. All channels are filtered in one call
+    and the output length follows the duration, ceil(frames * new_samplerate / old_samplerate)."""
+    from scipy.signal import upfirdn
+    up, down = rate_ratio(old_samplerate, new_samplerate)
+    if up == down:
+        return data.copy()
+    dtype = np.result_type(data.dtype, np.float32)
+    h, delay = get_filter_bank(up, down, dtype.str)
+    y = upfirdn(h, data, up, down, axis=0)[delay:delay + resampled_length(len(data), up, down)]
+    missing = resampled_length(len(data), up, down) - len(y)
+    if missing > 0:
+        # past the end of the filter response the output is silent
+        y = np.concatenate((y, np.zeros((missing,) + y.shape[1:], dtype=y.dtype)))
+    return y
+
+class SvResampler:
+    """Stateful polyphase resampler for chunked input.
+
+    Feed chunks of any size (mono or (frames, channels)) to process(), then call flush() once the input has ended.
+    The concatenated output is identical to resample_array over the whole input. Only the last few input samples
+    the filter still needs are kept between chunks.
+    """
+    def __init__(self, old_samplerate, new_samplerate, dtype='float64') -> None:
+        self.up, self.down = rate_ratio(old_samplerate, new_samplerate)
+        self.h, self.delay = get_filter_bank(self.up, self.down, np.dtype(dtype).str)
+        self.reset()
+
+    def reset(self):
+        """Clears the streaming state so a new signal can be processed"""
+        self._buffer = None
+        # global index of the first buffered input sample, always a multiple of down
+        self._buffer_start = 0
+        self._frames_in = 0
+        # next filter output index to compute, including the delay samples that get dropped
+        self._next = 0
+        self._frames_out = 0
+
+    def _compute(self) -> np.ndarray:
+        """Filters the buffered input and returns every output that no longer depends on future input"""
+        from scipy.signal import upfirdn
+        up, down = self.up, self.down
+        stop = ((self._frames_in - 1) * up) // down + 1 if self._frames_in else 0
+        if stop <= self._next:
+            return self._buffer[:0]
+        first = self._buffer_start * up // down
+        y = upfirdn(self.h, self._buffer, up, down, axis=0)[self._next - first:stop - first]
+        self._next = stop
+        # keep only the input the next outputs still reach back to, starting on a multiple of down
+        needed = max(0, (stop * down - len(self.h) + 1) // up)
+        keep_from = needed // down * down
+        self._buffer = self._buffer[keep_from - self._buffer_start:]
+        self._buffer_start = keep_from
+        return y
+
+    def _emit(self, y:np.ndarray, limit:int=None) -> np.ndarray:
+        """drops the leading filter delay and, on flush, anything past the expected output length"""
+        skip = max(0, self.delay - (self._next - len(y)))
+        y = y[skip:]
+        if limit is not None:
+            y = y[:max(0, limit - self._frames_out)]
+        self._frames_out += len(y)
+        return y
+
+    def process(self, chunk:np.ndarray) -> np.ndarray:
+        """Feeds the next chunk of input and returns the output samples that are complete"""
+        if self.up == self.down:
+            return chunk.copy()
+        chunk = np.asarray(chunk, dtype=self.h.dtype)
+        self._buffer = chunk.copy() if self._buffer is None else np.concatenate((self._buffer, chunk))
+        self._frames_in += len(chunk)
+        return self._emit(self._compute())
+
+    def flush(self) -> np.ndarray:
+        """Returns the remaining output once the input has ended, and resets the streaming state"""
+        if self.up == self.down or self._buffer is None:
+            return np.zeros(0, dtype=self.h.dtype)
+        total = resampled_length(self._frames_in, self.up, self.down)
+        # the signal is zero extended, feed just enough zeros to complete the last outputs
+        last = self.delay + total - 1
+        frames_needed = -(-last * self.down // self.up) + 1
+        pad = max(0, frames_needed - self._frames_in)
+        self._buffer = np.concatenate((self._buffer, np.zeros((pad,) + self._buffer.shape[1:], dtype=self._buffer.dtype)))
+        self._frames_in += pad
+        y = self._emit(self._compute(), total)
+        self.reset()
+        return y
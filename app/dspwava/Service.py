@@ -0,0 +1,406 @@
+"""
+Local analysis service: an asyncio HTTP front end over a pool of warm worker processes.
+
+Every operation is an endpoint taking a JSON body (POST) or query parameters (GET), with the file in 'path':
+
+    POST /duration     {"path": "take.wav"}
+    POST /amplitude    {"path": "take.wav"}
+    POST /frequency    {"path": "take.wav", "frame_size": 4096}
+    POST /spectrogram  {"path": "take.wav", "nperseg": 512, "output": "take.spectrogram.npz"}
+    POST /features     {"path": "take.wav", "features": ["rms", "centroid"]}
+    POST /render       {"path": "take.wav", "output": "clean.wav", "steps": ["toMono", "high_pass_filter:cutoff_freq=80"]}
+    GET  /health
+    GET  /metrics
+
+Workers import the numeric core (never Qt) once at start up and stay warm. Identical requests for an unchanged file
+that arrive while one is in flight share its result (coalescing). Small jobs (duration, amplitude, frequency) arriving
+within batch_window seconds of each other go to a worker together as one task (micro-batching). Once max_pending
+distinct jobs are in flight new ones are refused with 503 and a Retry-After header (backpressure). /metrics reports
+per-endpoint request counts, errors and latency percentiles.
+
+Requests with a body must have a Content-Type of application/json, and requests with an Origin or Sec-Fetch-Site
+header are refused, so a web page open in a browser cannot reach the service: browsers add those headers to the
+requests of pages and cannot send JSON without an Origin. 'output' paths are resolved in the output directory the
+service was started with (created if missing), outputs are refused without one.
+
+    dspwava-serve --port 8765 --workers 4 --cache-dir cache/ --output-dir out/
+    curl -H 'Content-Type: application/json' -d '{"path": "take.wav"}' http://127.0.0.1:8765/frequency
+    curl 'http://127.0.0.1:8765/frequency?path=take.wav&frame_size=4096'
+"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, parse_qsl
+import numpy as np
+LOGGER = logging.getLogger(__name__)
+MAX_BODY_BYTES = 1 << 20
+LATENCY_WINDOW = 4096
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           415: 'Unsupported Media Type', 422: 'Unprocessable Entity', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+def _duration(path:str):
+    from .Signal import SvSignal
+    return SvSignal(path, stream=True).getDuration()
+
+def _amplitude(path:str):
+    from .Signal import SvSignal
+    return float(SvSignal(path, stream=True).getAmplitude())
+
+def _frequency(path:str, **params):
+    from .Signal import SvSignal
+    return float(SvSignal(path, stream=True).estimate_frequency(**params))
+
+def _spectrogram(path:str, output:str=None, **params):
+    from .Signal import SvSignal
+    f, t, spect = SvSignal(path, stream=True).getSpectrogram(**params)
+    if output:
+        np.savez(output, f=f, t=t, spectrogram=spect)
+    return {'shape': list(spect.shape), 'output': output}
+
+def _features(path:str, features=None, output:str=None, **params):
+    """saves the per-frame features to output if given and returns the mean of every feature"""
+    from .Signal import SvSignal
+    result = SvSignal(path, stream=True).getFeatures(None if features is None else tuple(features), **params)
+    if output:
+        np.save(output, result)
+    names = [n for n in result.dtype.names if n != 'time']
+    return {'frames': len(result), 'mean': {n: float(result[n].mean()) if len(result) else 0.0 for n in names}, 'output': output}
+
+def _render(path:str, output:str, steps:list=()):
+    """applies transform steps in the dspwava-batch syntax and writes the result"""
+    from .Signal import SvSignal
+    from .Batch import TRANSFORMS, parse_step
+    signal = SvSignal(path)
+    for step in steps:
+        params = parse_step(step)
+        op = params.pop('op')
+        if op not in TRANSFORMS:
+            raise ValueError(f'{op} is not a transform step')
+        TRANSFORMS[op](signal, **params)
+    signal.write(output)
+    return {'output': output, 'duration': signal.getDuration()}
+
+# name -> (function(path, **params), small job that may be batched)
+OPERATIONS = {
+    'duration': (_duration, True),
+    'amplitude': (_amplitude, True),
+    'frequency': (_frequency, True),
+    'spectrogram': (_spectrogram, False),
+    'features': (_features, False),
+    'render': (_render, False),
+}
+
+def _warm(cache_dir:str=None):
+    """worker initializer, pays the imports once per process"""
+    import scipy.signal, scipy.fft
+    from . import Signal, ExtraFilters, Batch
+    if cache_dir:
+        from .DiskCache import set_disk_cache
+        set_disk_cache(cache_dir)
+
+def run_jobs(jobs:list) -> list:
+    """Runs (operation, params) jobs in a worker and returns an (ok, result or error message) pair for each"""
+    results = []
+    for op, params in jobs:
+        try:
+            results.append((True, OPERATIONS[op][0](**params)))
+        except Exception as e:
+            results.append((False, f'{type(e).__name__}: {e}'))
+    return results
+
+class SvAnalysisService:
+    """asyncio HTTP server dispatching analyses to a process pool, see the module documentation"""
+    def __init__(self, workers:int=None, max_pending:int=64, batch_window:float=0.005, batch_size:int=16, cache_dir:str=None, output_dir:str=None) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.output_dir = os.path.realpath(output_dir) if output_dir else None
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+        self.max_pending = max_pending
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.cache_dir = cache_dir
+        self.pool = None
+        self.server = None
+        # coalescing key -> future of the job in flight
+        self.inflight = {}
+        self._batch = []
+        self._batch_timer = None
+        self.counters = collections.Counter()
+        self.metrics = {}
+
+    def _newPool(self):
+        # forked workers would inherit open client sockets and keep those connections from closing
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        return concurrent.futures.ProcessPoolExecutor(self.workers, multiprocessing.get_context(method), _warm, (self.cache_dir,))
+
+    async def start(self, host:str='127.0.0.1', port:int=8765, unix:str=None):
+        """Starts the workers and listens on host:port, or on a Unix socket path"""
+        self.pool = self._newPool()
+        # start every worker before the first request
+        await asyncio.gather(*(asyncio.wrap_future(self.pool.submit(run_jobs, [])) for _ in range(self.workers)))
+        if unix:
+            self.server = await asyncio.start_unix_server(self._connection, unix)
+        else:
+            self.server = await asyncio.start_server(self._connection, host, port)
+        LOGGER.info(f'Listening on {unix or self.address()} with {self.workers} workers')
+        return self
+
+    def address(self) -> tuple:
+        """returns the (host, port) the server listens on"""
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    # jobs
+
+    def _key(self, op:str, params:dict):
+        """the coalescing key: operation, parameters and the identity of the file's current contents"""
+        try:
+            stat = os.stat(params['path'])
+            identity = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            identity = None
+        return op, json.dumps(params, sort_keys=True, default=str), identity
+
+    async def submit(self, op:str, params:dict):
+        """Runs an operation and returns its result. Raises KeyError for unknown operations, OverflowError when
+        max_pending jobs are in flight and RuntimeError with the worker's message when the job fails."""
+        function, small = OPERATIONS[op]
+        key = self._key(op, params)
+        future = self.inflight.get(key)
+        if future is not None:
+            self.counters['coalesced'] += 1
+        else:
+            if len(self.inflight) >= self.max_pending:
+                self.counters['rejected'] += 1
+                raise OverflowError(f'{len(self.inflight)} jobs pending')
+            future = asyncio.get_running_loop().create_future()
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+            self._enqueue((op, params), future, small)
+        ok, result = await asyncio.shield(future)
+        if not ok:
+            raise RuntimeError(result)
+        return result
+
+    def _enqueue(self, job:tuple, future:asyncio.Future, small:bool):
+        if not small:
+            self._dispatch([(job, future)])
+            return
+        self._batch.append((job, future))
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+        elif self._batch_timer is None:
+            self._batch_timer = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+
+    def _flush(self):
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        batch, self._batch = self._batch, []
+        if batch:
+            self._dispatch(batch)
+
+    def _dispatch(self, batch:list):
+        """sends a list of (job, future) to a worker as one task"""
+        self.counters['tasks'] += 1
+        self.counters['jobs'] += len(batch)
+        pool = self.pool
+        try:
+            task = asyncio.wrap_future(pool.submit(run_jobs, [job for job, _ in batch]))
+        except BrokenProcessPool as e:
+            self._restart(pool)
+            task = asyncio.get_running_loop().create_future()
+            task.set_exception(e)
+        def done(task):
+            try:
+                results = task.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._restart(pool)
+                results = [(False, f'worker failed: {type(e).__name__}: {e}')] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        task.add_done_callback(done)
+
+    def _restart(self, pool):
+        """replaces a pool whose worker died, once however many of its tasks fail"""
+        if pool is not self.pool:
+            return
+        LOGGER.error('A worker died, restarting the pool')
+        self.counters['restarts'] += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = self._newPool()
+
+    # metrics
+
+    def _record(self, endpoint:str, seconds:float, status:int):
+        metric = self.metrics.setdefault(endpoint, {'count': 0, 'errors': 0, 'latencies': collections.deque(maxlen=LATENCY_WINDOW)})
+        metric['count'] += 1
+        metric['errors'] += status >= 400
+        metric['latencies'].append(seconds)
+
+    def getMetrics(self) -> dict:
+        """returns per-endpoint counts, errors and latency percentiles (ms) over the last LATENCY_WINDOW requests,
+        and the coalescing, batching and backpressure counters"""
+        endpoints = {}
+        for endpoint, metric in self.metrics.items():
+            latencies = np.array(metric['latencies']) * 1000
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+            endpoints[endpoint] = {'count': metric['count'], 'errors': metric['errors'], 'mean_ms': float(latencies.mean()) if len(latencies) else 0.0,
+                                   'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99), 'max_ms': float(latencies.max()) if len(latencies) else 0.0}
+        return {'endpoints': endpoints, 'pending': len(self.inflight), 'workers': self.workers, **self.counters}
+
+    # HTTP
+
+    async def _connection(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = time.perf_counter()
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                close = headers.get('connection', '').lower() == 'close'
+                if length > MAX_BODY_BYTES:
+                    # the body is left unread, so the connection cannot carry another request
+                    status, payload, close = 413, {'error': f'body over {MAX_BODY_BYTES} bytes'}, True
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = await self._handle(method, target, headers, body)
+                data = json.dumps(payload, default=str).encode()
+                extra = 'Retry-After: 1\r\n' if status == 503 else ''
+                if close:
+                    extra += 'Connection: close\r\n'
+                writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n{extra}\r\n'.encode() + data)
+                await writer.drain()
+                endpoint = urlsplit(target).path
+                # unknown paths share one entry, so clients cannot grow the metrics without bound
+                self._record(endpoint if status != 404 else '(unknown)', time.perf_counter() - start, status)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # idle keep-alive connections are cancelled on shut down
+            pass
+        finally:
+            writer.close()
+
+    def _outputPath(self, output:str) -> str:
+        """returns output resolved in the output directory, creating its directory, raises PermissionError if outputs
+        are disabled or it resolves outside of it"""
+        if self.output_dir is None:
+            raise PermissionError('outputs are disabled, start the service with --output-dir')
+        path = os.path.realpath(os.path.join(self.output_dir, output))
+        if os.path.commonpath((path, self.output_dir)) != self.output_dir:
+            raise PermissionError(f'output {output!r} is outside of the output directory')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    async def _handle(self, method:str, target:str, headers:dict, body:bytes) -> tuple:
+        """returns (status, payload) for a request"""
+        url = urlsplit(target)
+        name = url.path.strip('/')
+        if 'origin' in headers or 'sec-fetch-site' in headers:
+            return 403, {'error': 'requests from web pages are not accepted'}
+        if name == 'health':
+            return 200, {'status': 'ok'}
+        if name == 'metrics':
+            return 200, self.getMetrics()
+        if name not in OPERATIONS:
+            return 404, {'error': f'unknown endpoint {url.path}', 'endpoints': sorted(OPERATIONS) + ['health', 'metrics']}
+        if method not in ('GET', 'POST'):
+            return 405, {'error': 'use GET or POST'}
+        if body and headers.get('content-type', '').split(';')[0].strip().lower() != 'application/json':
+            return 415, {'error': 'use Content-Type: application/json'}
+        try:
+            params = json.loads(body) if body else {}
+            for key, value in parse_qsl(url.query):
+                try:
+                    params[key] = json.loads(value)
+                except ValueError:
+                    params[key] = value
+        except ValueError as e:
+            return 400, {'error': f'invalid JSON: {e}'}
+        if not isinstance(params, dict) or not isinstance(params.get('path'), str):
+            return 400, {'error': "a 'path' parameter is required"}
+        if params.get('output') is not None:
+            try:
+                params['output'] = self._outputPath(str(params['output']))
+            except PermissionError as e:
+                return 403, {'error': str(e)}
+        try:
+            return 200, {'result': await self.submit(name, params)}
+        except OverflowError as e:
+            return 503, {'error': f'busy, {e}'}
+        except RuntimeError as e:
+            return 422, {'error': str(e)}
+
+def request(endpoint:str, payload:dict=None, host:str='127.0.0.1', port:int=8765, timeout:float=60.0) -> tuple:
+    """Calls the service and returns (status, decoded JSON body). For tools and scripts on the same machine."""
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        body = json.dumps(payload).encode() if payload is not None else None
+        connection.request('POST' if body else 'GET', '/' + endpoint.strip('/'), body, {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='dspwava-serve', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on this Unix socket path instead of TCP')
+    parser.add_argument('--workers', type=int, help='worker processes (default cpu count)')
+    parser.add_argument('--max-pending', type=int, default=64, help='distinct jobs in flight before requests are refused with 503')
+    parser.add_argument('--batch-window', type=float, default=5.0, help='milliseconds small jobs wait to be batched together')
+    parser.add_argument('--batch-size', type=int, default=16, help='most small jobs sent to a worker at once')
+    parser.add_argument('--cache-dir', help='directory of the persistent analysis cache, see SvDiskCache')
+    parser.add_argument('--output-dir', help='directory the output paths of requests are written in, outputs are refused without it')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(asctime)s <%(levelname)s> [%(name)s] %(message)s', datefmt='%H:%M:%S',
+                        level=logging.INFO if args.verbose else logging.WARNING)
+    service = SvAnalysisService(args.workers, args.max_pending, args.batch_window / 1000, args.batch_size, args.cache_dir, args.output_dir)
+    async def serve():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        await service.start(args.host, args.port, args.unix)
+        print(f'dspwava-serve listening on {args.unix or "http://%s:%d" % service.address()}', flush=True)
+        try:
+            await stop.wait()
+        finally:
+            # also stops the workers
+            await service.close()
+    asyncio.run(serve())
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
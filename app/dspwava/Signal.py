@@ -1,33 +1,284 @@
 import soundfile as sf
 import numpy as np
-from scipy import signal
 import logging
-from .SimplePlot import SvSimplePlot
-from .SvSpectrogram import SvSpectrogram
-from PySide6.QtWidgets import QApplication, QVBoxLayout, QWidget
+# scipy.signal, Qt and the plot widgets are imported where they are used, so the numeric core starts fast without a display
+from .SignalSource import SvFileSource, SvMemmapSource
+from .Frames import iter_frame_spectra, parabolic_peaks, strongest_peak
+from .Stft import SvStft
+from .Fft import fft
+from .Resampler import SvResampler, resample_array
+from .AnalysisCache import SvAnalysisCache, cached, DEFAULT_CACHE_BYTES
+from .Profiler import instrument_class
+from .DiskCache import SvDiskCache, get_disk_cache, derived
 LOGGER = logging.getLogger(__name__)
 MONO = 'Mono'
 STEREO = 'Stereo'
+DEFAULT_BLOCKSIZE = 65536
+# sample precisions a signal can be processed in
+FLOAT_DTYPES = ('float32', 'float64')
+_default_dtype = np.dtype('float64')
+
+def peak_amplitude(data:np.ndarray, axis=None):
+    """returns max(abs(data)) along axis without building the full-size abs array"""
+    if axis == 0 and data.ndim == 2:
+        # numpy reduces the narrow axis 0 of (frames, channels) arrays slowly, one strided column at a time is much faster
+        return np.array([peak_amplitude(data[:, c]) for c in range(data.shape[1])])
+    return np.maximum(data.max(axis=axis), -data.min(axis=axis))
+
+def check_dtype(dtype) -> np.dtype:
+    """returns dtype as a np.dtype, raises a ValueError if it is not float32 or float64"""
+    dtype = np.dtype(dtype)
+    if dtype.name not in FLOAT_DTYPES:
+        raise ValueError(f"Unsupported sample dtype {dtype}, use one of {FLOAT_DTYPES}")
+    return dtype
+
+def set_default_dtype(dtype):
+    """Sets the precision new signals are loaded and processed in when they are not given a dtype, float64 or float32"""
+    global _default_dtype
+    _default_dtype = check_dtype(dtype)
+
+def get_default_dtype() -> np.dtype:
+    """returns the precision new signals use when they are not given a dtype"""
+    return _default_dtype
+
+def _qtApp():
+    """Imports Qt on first use and returns the running QApplication, creating one if needed"""
+    from PySide6.QtWidgets import QApplication
+    app = QApplication.instance()
+    if app == None:
+        app = QApplication()
+    return app
+
 class SvSignal:
-    """Signal Object class for reading audio waveforms and performing signal processing operations"""
-    def __init__(self, filepath:str=None, data=None, sr=None, channels = 1) -> None:
+    """Signal Object class for reading audio waveforms and performing signal processing operations
+    
+    With stream=True the file is not decoded up front. Only the metadata is read, and getDuration, getAmplitude,
+    normalize, toMono, estimate_frequency, getSpectrogram and write work block by block with bounded memory.
+    Any other method that needs the full sample array decodes the file into memory on first access.
+    
+    With mmap=True an uncompressed PCM or float WAV file is memory mapped instead of decoded. Float files expose
+    data directly as a copy-on-write np.memmap view over the file; integer PCM files behave like stream=True but
+    convert blocks straight from the map. Either way the source file is never modified. Files that cannot be
+    mapped fall back to stream=True.
+    
+    Analysis results (spectra, phase, frequency estimates, spectrograms) are memoized per signal by operation and
+    parameters, within cache_bytes. Every mutation bumps the data version, which invalidates them.
+    
+    dtype sets the sample precision, 'float64' or 'float32'. Files are decoded straight into it and resampling,
+    filtering, spectra (complex64 in float32), spectrograms and convolution keep it, halving memory and bandwidth in
+    float32. It defaults to the precision of float data passed in, the file precision of memory mapped float WAV files,
+    and otherwise to the global default, see set_default_dtype.
+    
+    disk_cache, an SvDiskCache or a directory (default the one set with set_disk_cache), keeps analysis results of file
+    signals across runs, keyed by the file's content, the operations that derived the signal from it (resample, toMono,
+    normalize, the filters) and the parameters. With a disk cache the file is only decoded when samples are first
+    needed, so a warm run that only reads cached results never decodes it.
+    
+    Mutators (normalize, the filters, pipelines run in place) modify the samples in place where the shape allows, and
+    getters that build a full-size result (getNormalized, getResample, getPhaseSpace) take an optional out= buffer.
+    copy() is copy-on-write: the copies share read-only samples until one of them is modified.
+    """
+    def __init__(self, filepath:str=None, data=None, sr=None, channels = 1, stream:bool=False, blocksize:int=DEFAULT_BLOCKSIZE, mmap:bool=False, cache_bytes:int=DEFAULT_CACHE_BYTES, dtype=None, disk_cache=None) -> None:
         self.filepath = filepath
+        floating = isinstance(data, np.ndarray) and data.dtype.name in FLOAT_DTYPES
+        self.dtype = check_dtype(dtype) if dtype is not None else (data.dtype if floating else get_default_dtype())
+        if floating and data.dtype != self.dtype:
+            data = data.astype(self.dtype)
+        self._data = None
+        self._source = None
+        self._version = 0
+        self._cache = SvAnalysisCache(cache_bytes)
+        # deferred operations applied to each streamed block, in order
+        self._ops = []
+        # set while the samples are shared copy-on-write with a copy of the signal
+        self._shared = False
+        # set while a file opened for the disk cache has not been decoded yet
+        self._lazy = False
+        # (function, name of its signal argument, arguments, lineage before it) of the derived operations recorded while lazy, see derived
+        self._deferred = []
+        disk_cache = get_disk_cache() if disk_cache is None else disk_cache
+        self._diskCache = SvDiskCache(disk_cache) if isinstance(disk_cache, str) else disk_cache or None
         self.data = data
         self.samplerate = sr
         self.channels = channels
+        self.blocksize = blocksize
         self.fp_name = None
         if filepath != None:
             self.filepath = filepath
-            self.data, self.samplerate = sf.read(filepath)
-            self.channels = len(self.data.shape)
+            if mmap:
+                try:
+                    self._source = SvMemmapSource(filepath)
+                except ValueError as e:
+                    LOGGER.info(f'{e}, streaming instead')
+                    self._source = SvFileSource(filepath)
+            elif stream or self._diskCache is not None:
+                self._source = SvFileSource(filepath)
+                self._lazy = not stream
+            if self._source is not None:
+                self.samplerate = self._source.samplerate
+                self.channels = self._source.channels
+                raw = self._source.raw if isinstance(self._source, SvMemmapSource) else None
+                if raw is not None and self._source.isFloat() and (dtype is None or raw.dtype == self.dtype):
+                    # zero-copy: the mapped samples are the signal data
+                    self.dtype = raw.dtype.newbyteorder('=')
+                    self._data = raw[:, 0] if self.channels == 1 else raw
+            else:
+                self.data, self.samplerate = sf.read(filepath, dtype=self.dtype.name)
+                self.channels = len(self.data.shape)
             self.fp_name = filepath.split('/')[-1]
+        # the derived operations applied since the file was read, None once the samples were changed any other way
+        self._lineage = () if filepath != None else None
+    
+    @property
+    def data(self) -> np.ndarray:
+        """The samples of the signal. Streamed signals are decoded into memory on first access."""
+        if self._deferred:
+            self._replay()
+        if self._data is None and self._source is not None:
+            self.load()
+        return self._data
+    
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._shared = False
+        self.touch()
+    
+    def touch(self):
+        """Marks the samples as modified, invalidating cached analysis results. 
+        Assigning data does this automatically, call it after modifying data in place."""
+        self._version += 1
+        self._lineage = None
+    
+    def getDataVersion(self) -> int:
+        """returns a counter that changes whenever the samples of the signal change"""
+        return self._version
+    
+    def getCache(self) -> SvAnalysisCache:
+        """returns the cache holding this signal's analysis results"""
+        return self._cache
+    
+    def getCacheStats(self) -> dict:
+        """returns hit/miss statistics of the analysis cache"""
+        return self._cache.getStats()
+    
+    def getDiskCache(self):
+        """returns the SvDiskCache of the signal, or None"""
+        return self._diskCache
+    
+    def _diskKey(self, key) -> str:
+        """returns the disk cache entry of an analysis key, or None when the signal's samples are not known from its file"""
+        if self._diskCache is None or self._lineage is None or self.filepath is None:
+            return None
+        return self._diskCache.key(self._diskCache.fileDigest(self.filepath), self.dtype.name, self._lineage, key)
+    
+    def setCacheBudget(self, max_bytes:int):
+        """Sets how many bytes of analysis results this signal may keep. 0 disables caching."""
+        self._cache.setBudget(max_bytes)
+        
     def copy(self):
-        """Returns a copy of the signal object"""
-        return SvSignal(filepath=self.filepath, data=self.data.copy(), sr=self.samplerate, channels=self.channels)
+        """Returns a copy of the signal object. 
+        
+        No samples are copied: both signals hold the same read-only samples until one of them is modified by an
+        SvSignal method, which gives it its own copy first. Write to data directly only after calling getWritableData."""
+        if self._data is None and self._source is not None:
+            signal = SvSignal(sr=self.samplerate, channels=self.channels, blocksize=self.blocksize, cache_bytes=self._cache.max_bytes, dtype=self.dtype, disk_cache=self._diskCache or False)
+            signal.filepath, signal.fp_name = self.filepath, self.fp_name
+            signal._source, signal._lazy, signal._lineage = self._source, self._lazy, self._lineage
+            signal._deferred = list(self._deferred)
+            signal._ops = list(self._ops)
+            return signal
+        if not self._shared:
+            shared = self._data.view()
+            shared.flags.writeable = False
+            self._data = shared
+            self._shared = True
+        signal = SvSignal(sr=self.samplerate, channels=self.channels, blocksize=self.blocksize, cache_bytes=self._cache.max_bytes, dtype=self.dtype, disk_cache=self._diskCache or False)
+        signal.filepath, signal.fp_name = self.filepath, self.fp_name
+        signal._data, signal._shared, signal._lineage = self._data, True, self._lineage
+        return signal
+    
+    def getWritableData(self) -> np.ndarray:
+        """Returns the samples ready to be modified in place. Samples shared with a copy, or otherwise read-only, are 
+        copied first, streamed signals are loaded. Call touch() after modifying them."""
+        self.validDataCheck()
+        data = self.data
+        if self._shared or not data.flags.writeable:
+            self._data = data.copy()
+            self._shared = False
+        return self._data
+    
+    def isStreaming(self) -> bool:
+        """returns True if the samples are read from disk block by block rather than held in memory"""
+        return self._data is None and self._source is not None and not self._lazy
+    
+    def load(self):
+        """Decodes a streamed signal into memory, applying any pending operations. Does nothing if already loaded."""
+        if self._data is not None or self._source is None:
+            return self
+        LOGGER.info(f'Decoding {self.fp_name} into memory')
+        self._data = self._applyOps(self._source.read(dtype=self.dtype.name))
+        self._source = None
+        self._ops = []
+        return self
+    
+    def _applyOps(self, block:np.ndarray) -> np.ndarray:
+        """Applies the deferred operations to a 2D (frames, channels) block read from the source"""
+        for op, arg in self._ops:
+            if op == 'gain':
+                block = block * np.asarray(arg, dtype=block.dtype)
+            elif op == 'mono':
+                block = block.mean(axis=1, keepdims=True)
+        # match sf.read, which returns 1D arrays for mono files
+        return block[:, 0] if block.shape[1] == 1 else block
+    
+    def blocks(self, blocksize:int=None, overlap:int=0):
+        """Yields the samples in consecutive blocks of blocksize frames, each block overlapping the previous one by overlap frames.
+        
+        Streamed signals are decoded one block at a time, so memory use is bounded by the block size.
+        """
+        self.validDataCheck()
+        blocksize = self.blocksize if blocksize is None else blocksize
+        if self.isStreaming():
+            for block in self._source.blocks(blocksize, overlap, self.dtype.name):
+                yield self._applyOps(block)
+            return
+        data = self.data
+        start = 0
+        while True:
+            yield data[start:start + blocksize]
+            start += blocksize - overlap
+            if start + overlap >= len(data):
+                break
             
+    def _replay(self):
+        """runs the derived operations recorded while the file was not decoded, then restores the lineage they recorded"""
+        deferred, self._deferred = self._deferred, []
+        lineage = self._lineage
+        for method, signal_name, arguments, before in deferred:
+            # analyses the operation runs are looked up at the lineage it starts from
+            self._lineage = before
+            method(**dict(arguments, **{signal_name: self}))
+        self._lineage = lineage
+
+    def _readFrames(self, start:int, stop:int) -> np.ndarray:
+        """returns frames start to stop, read from the source for streamed and not yet decoded signals"""
+        if self._deferred:
+            self._replay()
+        if self._data is None and self._source is not None:
+            return self._applyOps(self._source.read(start, stop, self.dtype.name))
+        return self.data[start:stop]
+    
+    def pipeline(self):
+        """Returns an SvPipeline that records operations on this signal and runs them fused, block by block, when run() is called"""
+        from .Pipeline import SvPipeline
+        return SvPipeline(self)
+    
     def validDataCheck(self):
-        """checks if the signal has valid data. If not, raises a ValueError"""
-        if self.data is None:
+        """checks if the signal has valid data. If not, raises a ValueError. Runs the deferred derived operations."""
+        if self._deferred:
+            self._replay()
+        if self._data is None and self._source is None:
             LOGGER.error('No signal data')
             raise ValueError("No signal data")
                
@@ -41,148 +292,281 @@ class SvSignal:
         self.validDataCheck()
         return self.data
     
+    def getRawSamples(self)->np.ndarray:
+        """returns the samples as stored in the source file, without decoding. 
+        For memory mapped signals this is the np.memmap over the file. Pending operations are not applied."""
+        self.validDataCheck()
+        if isinstance(self._source, SvMemmapSource):
+            return self._source.raw
+        return self.data
+    
+    def getFrameSegment(self, start:int, stop:int=None):
+        """Returns frames start to stop (default the end) as a new in-memory signal.
+        
+        Signals that have not decoded their file (stream=True, mmap=True, or opened for a disk cache) read only those
+        frames, seeking in the file, so the cost follows the length of the segment and not its position or the length
+        of the file. Compressed files are indexed once per process on the first such read, see SvSeekHandle.
+        The samples of in-memory signals are shared copy-on-write, as with copy().
+        """
+        self.validDataCheck()
+        frames = self.getNumFrames()
+        stop = frames if stop is None else min(int(stop), frames)
+        start = int(start)
+        if not 0 <= start <= stop:
+            LOGGER.error(f'Invalid segment {start}:{stop}')
+            raise ValueError(f'Invalid segment {start}:{stop} of a {frames} frame signal')
+        if self._data is None and self._source is not None:
+            data, shared = self._readFrames(start, stop), False
+        else:
+            if not self._shared:
+                self._data = self._data.view()
+                self._data.flags.writeable = False
+                self._shared = True
+            data, shared = self._data[start:stop], True
+        segment = SvSignal(sr=self.samplerate, channels=self.channels, blocksize=self.blocksize, cache_bytes=self._cache.max_bytes, dtype=self.dtype, disk_cache=self._diskCache or False)
+        segment.filepath, segment.fp_name = self.filepath, self.fp_name
+        segment._data, segment._shared = data, shared
+        # results of the segment keep their own disk cache entries
+        segment._lineage = None if self._lineage is None else self._lineage + (('getFrameSegment', start, stop),)
+        return segment
+    
+    def getSegment(self, start:float, stop:float=None):
+        """Returns the signal from start to stop seconds (default the end) as a new in-memory signal, see getFrameSegment"""
+        self.validDataCheck()
+        return self.getFrameSegment(round(start * self.samplerate), None if stop is None else round(stop * self.samplerate))
+    
+    def getNumFrames(self)->int:
+        """returns the number of frames (samples per channel) in the signal"""
+        self.validDataCheck()
+        if self._data is None and self._source is not None:
+            return self._source.frames
+        return len(self.data)
+    
     def getDuration(self)->float:
         """returns the duration of the signal in seconds"""
-        self.validDataCheck()
-        return len(self.data) / self.samplerate
+        return self.getNumFrames() / self.samplerate
+    
+    def getDtype(self) -> np.dtype:
+        """returns the sample precision of the signal, float32 or float64"""
+        return self.dtype
     
     def getNumChannels(self)->int:
         """returns the number of channels in the signal"""
         self.validDataCheck()
         return self.channels
     
+    @derived
     def toMono(self):
         """converts the signal to mono if it is stereo. Does nothing if it is already mono"""
         self.validDataCheck()
-        if self.channels == 2:
+        if self.channels == 2 and self.isStreaming():
+            self._ops.append(('mono', None))
+            self.channels = 1
+            self.touch()
+        elif self.channels == 2:
             self.data = np.mean(self.data, axis=1)
             self.channels = 1
         else:
             LOGGER.info(f'Already in mono')
             
+    @derived
     def resample(self, new_samplerate):
-        """resamples the signal to the new sample rate"""
+        """resamples the signal to the new sample rate. The original signal is modified.
+        
+        Uses rational polyphase filtering with a windowed-sinc anti-aliasing filter (see Resampler). 
+        Streamed signals are resampled block by block, so only the output is held in memory.
+        """
         self.validDataCheck()
         if self.samplerate == new_samplerate:
             LOGGER.info(f'Already at {new_samplerate} Hz')
             return
-        old_length = len(self.data)
-        num_channels = self.data.shape[1] if len(self.data.shape) > 1 else 1
-        # Calculate the ratio between old and new lengths
-        ratio = new_samplerate / old_length
-        # Generate the indices for the new signal
-        indices = np.arange(new_samplerate) / ratio
-        # Compute the integer and fractional parts of the indices
-        int_indices = indices.astype(int)
-        frac_indices = indices - int_indices
-        # Linear interpolation for each channel
-        resampled_signal = np.zeros((new_samplerate, num_channels))
-        for i in range(num_channels):
-            if num_channels == 1:
-                channel_signal = self.data
-            else:
-                channel_signal = self.data[:, i]
-            resampled_signal[:, i] = (1 - frac_indices) * channel_signal[int_indices] + frac_indices * channel_signal[int_indices + 1]
-        self.data = resampled_signal
+        if self.isStreaming():
+            resampler = SvResampler(self.samplerate, new_samplerate, self.dtype)
+            parts = [resampler.process(block) for block in self.blocks()]
+            parts.append(resampler.flush())
+            self.data = np.concatenate(parts)
+            self._source = None
+            self._ops = []
+        else:
+            # cached results are read-only, the first in place change copies them
+            self.data = self.getResample(new_samplerate)
         self.samplerate = new_samplerate
     
-    def getResample(self, new_samplerate):
-        """Returns a resampled version of the signal to the new sample rate. The original signal is not modified."""
+    @cached
+    def getResample(self, new_samplerate, out:np.ndarray=None)->np.ndarray:
+        """Returns a resampled version of the signal to the new sample rate. The original signal is not modified.
+        The result is written to out if given, ceil(frames * new_samplerate / samplerate) frames (results in out are not cached),
+        block by block so no full-size temporary is allocated."""
         self.validDataCheck()
         if self.samplerate == new_samplerate:
             LOGGER.info(f'Already at {new_samplerate} Hz')
-            return
-        old_length = len(self.data)
-        num_channels = self.data.shape[1] if len(self.data.shape) > 1 else 1
-        # Calculate the ratio between old and new lengths
-        ratio = new_samplerate / old_length
-        # Generate the indices for the new signal
-        indices = np.arange(new_samplerate) / ratio
-        # Compute the integer and fractional parts of the indices
-        int_indices = indices.astype(int)
-        frac_indices = indices - int_indices
-        # Linear interpolation for each channel
-        resampled_signal = np.zeros((new_samplerate, num_channels))
-        for i in range(num_channels):
-            if num_channels == 1:
-                channel_signal = self.data
-            else:
-                channel_signal = self.data[:, i]
-            resampled_signal[:, i] = (1 - frac_indices) * channel_signal[int_indices] + frac_indices * channel_signal[int_indices + 1]
-        return resampled_signal
+            if out is None:
+                return self.data.copy()
+            out[...] = self.data
+            return out
+        if out is None:
+            return resample_array(self.data, self.samplerate, new_samplerate)
+        resampler = SvResampler(self.samplerate, new_samplerate, self.dtype)
+        position = 0
+        for block in self.blocks():
+            y = resampler.process(block)
+            out[position:position + len(y)] = y
+            position += len(y)
+        y = resampler.flush()
+        out[position:position + len(y)] = y
+        if position + len(y) != len(out):
+            raise ValueError(f'out holds {len(out)} frames, the resampled signal has {position + len(y)}')
+        return out
     
+    @cached
     def getAmplitude(self) -> float:
         """Returns the maximum amplitude of the audio signal."""
         self.validDataCheck()
+        if self.isStreaming():
+            return max(peak_amplitude(block) for block in self.blocks())
         if self.data.ndim == 1 or self.data.ndim == 2:  # Check for mono or multi-channel data
-            amplitude = np.max(np.abs(self.data))
+            amplitude = peak_amplitude(self.data)
         else:
             raise ValueError("Unsupported number of signal channels")
         
         return amplitude
     
 
+    @derived
     def normalize(self, target_amplitude=1.0):
         """normalizes the signal to the specified target amplitude. The original signal is modified."""
         self.validDataCheck()
+        if self.isStreaming():
+            # one pass to find the peaks, the gain itself is applied as each block is read
+            max_amplitude = 0
+            for block in self.blocks():
+                max_amplitude = np.maximum(max_amplitude, peak_amplitude(block, axis=0))
+            silent = max_amplitude == 0
+            if np.all(silent):
+                return
+            scaling = np.where(silent, 1.0, target_amplitude / np.where(silent, 1.0, max_amplitude))
+            self._ops.append(('gain', scaling))
+            self.touch()
+            return
         if len(self.data.shape) == 1:  # Mono signal
             max_amplitude = self.getAmplitude()
             if max_amplitude == 0:
                 return
-            scaling_factor = target_amplitude / max_amplitude
-            normalized_signal = self.data * scaling_factor
+            scaling = np.asarray(target_amplitude / max_amplitude, dtype=self.dtype)
             
         elif len(self.data.shape) == 2:  # Stereo or multi-channel signal
-            max_amplitude_per_channel = np.max(np.abs(self.data), axis=0)
+            max_amplitude_per_channel = peak_amplitude(self.data, axis=0)
             silent_channels = max_amplitude_per_channel == 0
-            scaling_factors = np.where(silent_channels, 1.0, target_amplitude / max_amplitude_per_channel)
-            normalized_signal = self.data * scaling_factors
+            scaling = np.where(silent_channels, 1.0, target_amplitude / max_amplitude_per_channel).astype(self.dtype)
         
         else:
             raise ValueError("Unsupported number of signal channels")
         
-        self.data = normalized_signal
+        if self.data.dtype.kind == 'f':
+            # scaled in place, no new array. Column by column, broadcasting over narrow rows is slow.
+            data = self.getWritableData()
+            if data.ndim == 1:
+                data *= scaling
+            else:
+                for c in range(data.shape[1]):
+                    data[:, c] *= scaling[c]
+            self.touch()
+        else:
+            self.data = self.data * scaling
         
-    def getNormalized(self, target_amplitude=1.0)->np.ndarray:
-        """returns a normalized version of the signal with the specified target amplitude. The original signal is not modified."""
+    def getNormalized(self, target_amplitude=1.0, out:np.ndarray=None)->np.ndarray:
+        """returns a normalized version of the signal with the specified target amplitude. The original signal is not modified.
+        The result is written to out if given, which may be the samples themselves."""
         if len(self.data.shape) == 1:  # Mono signal
             max_amplitude = self.getAmplitude()
             if max_amplitude == 0:
                 return
-            scaling_factor = target_amplitude / max_amplitude
-            normalized_signal = self.data * scaling_factor
+            scaling = np.asarray(target_amplitude / max_amplitude, dtype=self.dtype)
             
         elif len(self.data.shape) == 2:  # Stereo or multi-channel signal
-            max_amplitude_per_channel = np.max(np.abs(self.data), axis=0)
+            max_amplitude_per_channel = peak_amplitude(self.data, axis=0)
             silent_channels = max_amplitude_per_channel == 0
-            scaling_factors = np.where(silent_channels, 1.0, target_amplitude / max_amplitude_per_channel)
-            normalized_signal = self.data * scaling_factors
+            scaling = np.where(silent_channels, 1.0, target_amplitude / max_amplitude_per_channel).astype(self.dtype)
         
         else:
             raise ValueError("Unsupported number of signal channels")
         
-        return normalized_signal
+        return np.multiply(self.data, scaling, out=out)
+    
+    @cached
+    def getPitchEstimate(self, frame_size:int=2048, hop_size:int=512, window:str='hanning')->tuple[np.ndarray, np.ndarray]:
+        """Returns (t, pitch), the frame centre times and the frequency of the strongest spectral peak in every frame.
+        
+        The peak bin is refined to sub-bin accuracy with parabolic interpolation of the log magnitude spectrum
+        https://ccrma.stanford.edu/~jos/sasp/Sinusoidal_Peak_Interpolation.html
+        All frames are transformed in vectorized batches. Silent frames report 0 Hz.
+        """
+        self.validDataCheck()
+        times, pitches = [], []
+        for offset, data in self._frameBlocks(frame_size, hop_size):
+            for first, spectra in iter_frame_spectra(data, frame_size, hop_size, window):
+                magnitude = np.abs(spectra)
+                bins, _ = parabolic_peaks(magnitude)
+                pitch = bins * self.samplerate / frame_size
+                pitch[magnitude.max(axis=1) == 0] = 0
+                starts = offset + (first + np.arange(len(spectra))) * hop_size
+                times.append((starts + frame_size / 2) / self.samplerate)
+                pitches.append(pitch)
+        if not pitches:
+            return np.zeros(0), np.zeros(0)
+        return np.concatenate(times), np.concatenate(pitches)
     
-    def getPitchEstimate(self):
-        # uisng parabolic interpolation https://ccrma.stanford.edu/~jos/sasp/Sinusoidal_Peak_Interpolation.html
-        pass
+    def _frameBlocks(self, frame_size:int, hop_size:int):
+        """Yields (first sample, samples) pieces of the signal to be cut into frames of frame_size every hop_size samples.
+        
+        In memory signals give a single piece. Streamed pieces overlap by one frame minus one hop and hold a whole
+        number of hops, so every frame falls in exactly one piece, the same frames the in-memory signal would give.
+        """
+        if not self.isStreaming():
+            yield 0, self.data
+            return
+        overlap = max(frame_size - hop_size, 0)
+        step = max(1, self.blocksize // hop_size) * hop_size
+        for i, block in enumerate(self.blocks(step + overlap, overlap)):
+            yield i * step, block
     
+    @cached
     def getSpectrogram(self, nperseg=256, noverlap=None, nfft=None, window='hann', scaling='density')->tuple[np.ndarray, np.ndarray, np.ndarray]:
-        """Returns (f, t, spectrogram) the  array of sample freqs, array of segment lines, and computed spectrogram array of the signal"""
+        """Returns (f, t, spectrogram) the  array of sample freqs, array of segment lines, and computed spectrogram array of the signal.
+        Collects the batches of iterSpectrogram, the result is the same as scipy.signal.spectrogram over the whole signal."""
+        self.validDataCheck()
+        # as scipy, a signal shorter than a segment is transformed as a single segment
+        nperseg = min(nperseg, self.getNumFrames())
+        times, spects = [], []
+        stft = SvStft(self.samplerate, nperseg, noverlap, nfft, window, scaling)
+        for t, spect in stft.stream(self.blocks()):
+            times.append(t)
+            spects.append(spect)
+        if not spects:
+            t, spect = stft.empty(self.getNumChannels())
+            return stft.frequencies, t, spect
+        # multichannel data gives a (channels, f, t) array
+        return stft.frequencies, np.concatenate(times), np.concatenate(spects, axis=-1)
+    
+    def iterSpectrogram(self, nperseg=256, noverlap=None, nfft=None, window='hann', scaling='density'):
+        """Yields (t, spectrogram) batches of segments as the signal is read block by block, see SvStft. 
+        Memory use does not depend on the length of the signal."""
         self.validDataCheck()
-        f, t, spectrogram = signal.spectrogram(self.data, fs=self.samplerate, nperseg=nperseg, noverlap=noverlap, nfft=nfft, window=window, scaling=scaling)
-        # f: array of sample frequencies
-        # t: array of segment times
-        # spectrogram: 2D array of power spectral density
-        return f,t, spectrogram
+        yield from SvStft(self.samplerate, nperseg, noverlap, nfft, window, scaling).stream(self.blocks())
+    
     
+    @cached
+    def getEnvelope(self):
+        """returns the min/max envelope pyramid used to draw the waveform, see SvEnvelope"""
+        from .Envelope import SvEnvelope
+        return SvEnvelope(self)
     
     def visualize(self):
-        """Visualizes the signal in a plot"""
-        app = QApplication.instance()
-        if app == None:
-            app = QApplication()
-            
+        """Visualizes the signal in a plot. The waveform is drawn from its envelope pyramid at screen resolution."""
+        from PySide6.QtWidgets import QVBoxLayout, QWidget
+        from .SimplePlot import SvSimplePlot
+        app = _qtApp()
+        envelope = self.getEnvelope()
         if self.channels == 2:
             plot_l = SvSimplePlot()
             plot_r = SvSimplePlot()
@@ -191,29 +575,29 @@ class SvSignal:
             lay.addWidget(plot_r)
             plot = QWidget()
             plot.setLayout(lay)
-            samples_l = self.data[0]
-            samples_r = self.data[1]
-            plot_l.draw_signal(np.linspace(0, self.getDuration(), len(samples_l)), samples_l)
-            plot_r.draw_signal(np.linspace(0, self.getDuration(), len(samples_r)), samples_r)
+            plot_l.draw_envelope(envelope, channel=0, x_label='Time (s)', y_label='Amplitude')
+            plot_r.draw_envelope(envelope, channel=1, x_label='Time (s)', y_label='Amplitude')
+            # pan and zoom both channels together
+            plot_r.plot_widget.setXLink(plot_l.plot_widget)
             
         else:
             plot = SvSimplePlot()
-            plot.draw_signal(np.linspace(0, self.getDuration(), len(self.data)), self.getSamples(), x_label='Time (s)', y_label='Amplitude')
+            plot.draw_envelope(envelope, x_label='Time (s)', y_label='Amplitude')
         plot.show()
         app.exec()
         
-    def visualize_Spect(self):
-        """Visualizes the spectrogram of the signal"""
-        app = QApplication.instance()
-        if app == None:
-            app = QApplication()
+    def visualize_Spect(self, nperseg=256, noverlap=None):
+        """Visualizes the spectrogram of the signal. Tiles are computed in the background and refined on zoom."""
+        from .SvSpectrogram import SvSpectrogram
+        app = _qtApp()
         spec = SvSpectrogram()
         spec.setWindowTitle('Spectrogram')
-        spec.draw(self.getSpectrogram()[2])
+        spec.draw_signal(self, nperseg=nperseg, noverlap=noverlap)
         spec.show()
         app.exec()
         
         
+    @cached
     def estimate_frequency(self, frame_size:int=2048, hop_size:int=1024)->float:
         """
          A basic approach to frequency estimation. Adjust the frame_size, hop_size, or other parameters. 
@@ -230,99 +614,121 @@ class SvSignal:
          
         """
         self.validDataCheck()
-        data = self.data.copy()
-        samplerate = self.samplerate
-        # If stereo, convert to mono by averaging the two channels
-        if len(data.shape) > 1:
-            data = data.mean(axis=1)
-
         # Initialize variables
         max_frequency = 0
         max_magnitude = 0
-
-        # Process audio in frames
-        for start in range(0, len(data), hop_size):
-            end = start + frame_size
-            if end > len(data):
-                break
-            frame = data[start:end]
-
-            # Apply a window function to reduce spectral leakage
-            windowed = frame * np.hanning(len(frame))
-
-            # Compute the FFT and get the magnitude spectrum
-            spectrum = np.fft.rfft(windowed)
-            magnitude = np.abs(spectrum)
-
-            # Find the peak in the magnitude spectrum
-            peak = np.argmax(magnitude)
-            frequency = peak * samplerate / len(windowed)
-
-            # Update maximum frequency based on magnitude
-            if magnitude[peak] > max_magnitude:
-                max_magnitude = magnitude[peak]
-                max_frequency = frequency
+        # Frames are windowed (reducing spectral leakage) and transformed in batches, stereo frames are averaged to mono
+        for _, data in self._frameBlocks(frame_size, hop_size):
+            magnitude, peak = strongest_peak(data, frame_size, hop_size)
+            if magnitude > max_magnitude:
+                max_magnitude = magnitude
+                max_frequency = peak * self.samplerate / frame_size
 
         return max_frequency
     
+    @cached
+    def getFeatures(self, features:tuple=None, frame_size:int=2048, hop_size:int=1024, rolloff_percent:float=0.85)->np.ndarray:
+        """returns per-frame rms, zcr, centroid, rolloff, flux and peak frequency/magnitude (or the named subset) as a
+        structured array with a 'time' field, all from one framing and FFT pass, see SvFeatureExtractor"""
+        from .Features import extract_features, FEATURES
+        self.validDataCheck()
+        return extract_features(self, FEATURES if features is None else features, frame_size, hop_size, rolloff_percent=rolloff_percent)
     
     def write(self, filepath:str):
         """Writes the signal to a file"""
         self.validDataCheck()
-        sf.write(filepath, self.data, self.samplerate)
+        if self.isStreaming():
+            with sf.SoundFile(filepath, 'w', samplerate=self.samplerate, channels=self.channels) as f:
+                for block in self.blocks():
+                    f.write(block)
+        else:
+            sf.write(filepath, self.data, self.samplerate)
         LOGGER.info(f'Signal written to {filepath}')
     
     
+    @cached
     def getPhaseSpectrum(self):
         """Returns the phase spectrum of the signal"""
         """A method to compute and return the phase spectrum of the audio signal. 
         The phase spectrum gives information about the phase angle of each frequency component in the signal, 
         which is crucial for many signal processing tasks such as sound synthesis and modification."""
         self.validDataCheck()
-        spectrum = np.fft.fft(self.data)
+        # along the frames, one spectrum per channel
+        spectrum = fft(self.data, axis=0)
         # get phase of the spectrum
         return np.angle(spectrum)
     
+    @cached
     def getUnwrappedPhase(self):
         """Unwraps the phase spectrum in case of discontinuity"""
         phase = self.getPhaseSpectrum()
-        unwrapped_phase = np.unwrap(phase)
+        unwrapped_phase = np.unwrap(phase, axis=0)
         return unwrapped_phase
     
-    def getInstantaneousFrequency(self):
+    @cached
+    def getInstantaneousFrequency(self, margin:int=None):
         """
-        Computes the instantaneous frequency of the signal from its unwrapped phase.
-        This function computes the derivative of the unwrapped phase spectrum with respect to time,
-        providing the instantaneous frequency of each component of the signal. 
-        This can be useful in vibrato analysis and modulation effects.
+        Computes the instantaneous frequency of the signal in Hz, between every pair of consecutive samples (one value
+        fewer than the signal has frames), per channel. The phase advance of the analytic (Hilbert) signal from one
+        sample to the next is its frequency, which makes this useful in vibrato analysis and modulation effects.
+        The analytic signal is computed block by block with margin samples of overlap, see SvAnalytic, so only the
+        result is full length. iterInstantaneousFrequency yields the same values in bounded memory.
         """
-        unwrapped_phase = self.getUnwrappedPhase()
-        # Time vect
-        time_vector = np.linspace(0, len(self.data) / self.samplerate, num=len(self.data))
-        # Compute derivative of phase rect to time
-        inst_frequency = np.diff(unwrapped_phase) / np.diff(time_vector)
-        return inst_frequency
-    
-    def getPhaseSpace(self):
-        """Computes the phase space of the signal"""
         self.validDataCheck()
+        out = np.empty((max(self.getNumFrames() - 1, 0),) + ((self.channels,) if self.channels > 1 else ()), dtype=self.dtype)
+        for _ in self.iterInstantaneousFrequency(margin=margin, out=out):
+            pass
+        return out
+    
+    def iterInstantaneousFrequency(self, blocksize:int=None, margin:int=None, out:np.ndarray=None):
+        """Yields the instantaneous frequency of getInstantaneousFrequency block by block, as the signal is read.
+        With out, frames - 1 long, the blocks are views of it, see instantaneous_frequency."""
+        from .Analytic import SvAnalytic, instantaneous_frequency, DEFAULT_MARGIN
+        self.validDataCheck()
+        analytic = SvAnalytic(blocksize or self.blocksize, margin or DEFAULT_MARGIN, reuse=True)
+        yield from instantaneous_frequency(analytic.stream(self.blocks()), self.samplerate, out)
+    
+    @cached
+    def getFrameFrequencies(self, frame_size:int=2048, hop_size:int=256, window:str='hann')->tuple[np.ndarray, np.ndarray]:
+        """Returns (t, frequency): per frame, the phase vocoder instantaneous frequency of the strongest STFT bin, per
+        channel. The frequency is refined from the phase advance between frames far beyond the bin spacing, see
+        SvPhaseVocoder, which suits pitch and vibrato tracks. t is the centre of every frame in seconds."""
+        from .Analytic import SvPhaseVocoder
+        self.validDataCheck()
+        vocoder = SvPhaseVocoder(self.samplerate, frame_size, hop_size, window)
+        total = 0 if self.getNumFrames() < frame_size else 1 + (self.getNumFrames() - frame_size) // hop_size
+        frequency = np.empty((total,) + ((self.channels,) if self.channels > 1 else ()), dtype=self.dtype)
+        for first_sample, data in self._frameBlocks(frame_size, hop_size):
+            for start, inst, magnitude in vocoder.process(data):
+                first = first_sample // hop_size + start
+                peaks = np.argmax(magnitude, axis=-1)
+                frequency[first:first + len(inst)] = np.take_along_axis(inst, peaks[..., None], axis=-1)[..., 0]
+        t = (np.arange(total) * hop_size + frame_size / 2) / self.samplerate
+        return t, frequency
+    
+    @cached
+    def getPhaseSpace(self, out:np.ndarray=None):
+        """Computes the phase space of the signal, into out if given (one value per frame, results in out are not cached)"""
+        self.validDataCheck()
+        data = self.data
+        # Calculate the first derivative of the signal, straight into the result
+        first_derivative = np.empty(len(data), dtype=data.dtype) if out is None else out
         if self.channels > 1:
-            data = np.mean(self.data, axis=1)
+            # of the mono mix, one block at a time so the mix of the whole signal is never built
+            for start in range(0, len(data) - 1, self.blocksize):
+                mono = np.mean(data[start:start + self.blocksize + 1], axis=1)
+                np.subtract(mono[1:], mono[:-1], out=first_derivative[start + 1:start + len(mono)])
         else:
-            data = self.data
-        
-        # Calculate the first derivative of the signal
-        first_derivative = np.diff(data, n=1)
-        # To align with the data length, prepend the first derivative with the first element of the data or another method
-        first_derivative = np.concatenate(([first_derivative[0]], first_derivative))
+            np.subtract(data[1:], data[:-1], out=first_derivative[1:])
+        # To align with the data length, the first value repeats the first derivative
+        first_derivative[0] = first_derivative[1]
         
         return first_derivative
     
     def visualizePhase(self):
         """Visualizes the phase spectrum of the signal"""
-        app = QApplication.instance()
-        if app == None:
-            app = QApplication()
+        from .SimplePlot import SvSimplePlot
+        app = _qtApp()
         plot = SvSimplePlot()
         plot.draw_signal(np.linspace(0, self.getDuration(), len(self.getUnwrappedPhase())), self.getUnwrappedPhase(), x_label='Time (s)', y_label='Phase')
         plot.setWindowTitle(f'{"" if self.fp_name == None else self.fp_name }Phase Spectrum')
@@ -331,9 +737,8 @@ class SvSignal:
         
     def visualizePhaseSpace(self):
         """Visualizes the phase space of the signal"""
-        app = QApplication.instance()
-        if app == None:
-            app = QApplication()
+        from .SimplePlot import SvSimplePlot
+        app = _qtApp()
         plot = SvSimplePlot()
         
         if self.channels > 1:
@@ -348,4 +753,7 @@ class SvSignal:
         plot.draw_signal(data, first_derivative, x_label='Signal', y_label='First Derivative')
         plot.setWindowTitle(f'{"" if self.fp_name == None else self.fp_name }Phase Space')
         plot.show()
-        app.exec()
\ No newline at end of file
+        app.exec()
+
+# public methods record themselves when an SvProfiler is active
+instrument_class(SvSignal)
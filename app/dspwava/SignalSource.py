@@ -0,0 +1,205 @@
+import soundfile as sf
+import numpy as np
+import collections
+import logging
+import os
+import threading
+LOGGER = logging.getLogger(__name__)
+# formats whose decoder needs the frames before a seek point to reproduce a full decode exactly, and how many samples
+# of them to decode again: 8 MPEG frames of 1152 samples cover the bit reservoir and the synthesis filter history
+SEEK_PREROLL = {'MP3': 8 * 1152}
+# files kept open for random access reads, least recently used closed first
+SEEK_HANDLES = 16
+
+class SvSeekHandle:
+    """An open file for random access reads of frame ranges.
+
+    Opening a compressed file that is seeked by scanning (MP3) builds its seek index: the decoder walks the frame
+    headers to the end once, without decoding, and remembers where every frame starts. Later seeks jump to the nearest
+    indexed frame, so a read costs time proportional to its length rather than to its position in the file. Each read
+    decodes SEEK_PREROLL samples before the requested start and drops them, which makes it match a full decode exactly.
+    Reads through one handle are serialized, see seek_handle for the shared handles.
+    """
+    def __init__(self, filepath:str) -> None:
+        self.filepath = filepath
+        self.file = sf.SoundFile(filepath)
+        self.frames = self.file.frames
+        self.preroll = SEEK_PREROLL.get(self.file.format, 0)
+        self.lock = threading.Lock()
+        if self.preroll and self.frames:
+            self.file.seek(self.frames - 1)
+
+    def read(self, start:int=0, stop:int=None, dtype='float64') -> np.ndarray:
+        """Decodes frames [start, stop) of the file. Always returns a 2D (frames, channels) array"""
+        stop = self.frames if stop is None else min(stop, self.frames)
+        start = min(start, stop)
+        first = max(0, start - self.preroll)
+        with self.lock:
+            self.file.seek(first)
+            data = self.file.read(stop - first, dtype=dtype, always_2d=True)
+        return data[start - first:]
+
+# (path, size, mtime) -> SvSeekHandle
+_handles = collections.OrderedDict()
+_handles_lock = threading.Lock()
+
+def _forget_handles():
+    """a forked child must not share file positions with its parent, it opens its own handles"""
+    global _handles_lock
+    _handles.clear()
+    _handles_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_handles)
+
+def seek_handle(filepath:str) -> SvSeekHandle:
+    """Returns the process-wide SvSeekHandle of a file, opening and indexing it on first use. A file that changed on
+    disk is opened again, and beyond SEEK_HANDLES open files the least recently used is dropped."""
+    stat = os.stat(filepath)
+    key = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+    with _handles_lock:
+        handle = _handles.get(key)
+        if handle is not None:
+            _handles.move_to_end(key)
+            return handle
+    handle = SvSeekHandle(filepath)
+    with _handles_lock:
+        # another thread may have opened it meanwhile, keep the first
+        handle = _handles.setdefault(key, handle)
+        _handles.move_to_end(key)
+        for stale in [k for k in _handles if k[0] == key[0] and k != key]:
+            del _handles[stale]
+        while len(_handles) > SEEK_HANDLES:
+            # closed once the readers still holding it are done
+            _handles.popitem(last=False)
+    return handle
+
+class SvFileSource:
+    """Lazy handle to an audio file. Reads the metadata up front and only decodes frames when they are requested."""
+    def __init__(self, filepath:str) -> None:
+        info = sf.info(filepath)
+        self.filepath = filepath
+        self.samplerate = info.samplerate
+        self.channels = info.channels
+        self.frames = info.frames
+        self.format = info.format
+        self.subtype = info.subtype
+
+    def read(self, start:int=0, stop:int=None, dtype='float64') -> np.ndarray:
+        """Decodes frames [start, stop) of the file. Always returns a 2D (frames, channels) array.
+        Ranges other than the whole file are read through the file's seek handle, see SvSeekHandle."""
+        if start == 0 and stop is None:
+            data, _ = sf.read(self.filepath, dtype=dtype, always_2d=True)
+            return data
+        return seek_handle(self.filepath).read(start, stop, dtype)
+
+    def blocks(self, blocksize:int, overlap:int=0, dtype='float64'):
+        """Yields 2D (frames, channels) blocks of the file, decoding one block at a time"""
+        with sf.SoundFile(self.filepath) as f:
+            for block in f.blocks(blocksize=blocksize, overlap=overlap, dtype=dtype, always_2d=True):
+                yield block
+
+# WAVE format tags
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# (format tag, bits per sample) -> (numpy dtype, offset, scale) used to convert the stored samples to floats in [-1, 1)
+WAV_SAMPLE_TYPES = {
+    (WAVE_FORMAT_PCM, 8): ('u1', 128, 1 / 128),
+    (WAVE_FORMAT_PCM, 16): ('<i2', 0, 1 / 2**15),
+    (WAVE_FORMAT_PCM, 32): ('<i4', 0, 1 / 2**31),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): ('<f4', 0, None),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): ('<f8', 0, None),
+}
+
+def read_wav_layout(filepath:str) -> dict:
+    """Parses the RIFF header of a WAV file and returns where the sample data lives and how it is stored.
+    Raises a ValueError if the file is not a WAV file whose samples can be memory mapped."""
+    fmt = None
+    with open(filepath, 'rb') as f:
+        f.seek(0, 2)
+        file_size = f.tell()
+        f.seek(0)
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise ValueError(f'{filepath} is not a RIFF WAVE file')
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f'{filepath} has no data chunk')
+            chunk_id, chunk_size = header[:4], int.from_bytes(header[4:], 'little')
+            if chunk_id == b'fmt ':
+                chunk = f.read(chunk_size)
+                tag = int.from_bytes(chunk[0:2], 'little')
+                if tag == WAVE_FORMAT_EXTENSIBLE and len(chunk) >= 26:
+                    # the actual format tag is the first two bytes of the sub format GUID
+                    tag = int.from_bytes(chunk[24:26], 'little')
+                fmt = {'tag': tag,
+                       'channels': int.from_bytes(chunk[2:4], 'little'),
+                       'samplerate': int.from_bytes(chunk[4:8], 'little'),
+                       'block_align': int.from_bytes(chunk[12:14], 'little'),
+                       'bits': int.from_bytes(chunk[14:16], 'little')}
+                f.seek(chunk_size % 2, 1)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f'{filepath} has no fmt chunk before its data chunk')
+                offset = f.tell()
+                # streamed writers may leave the size unset, in which case the data runs to the end of the file
+                chunk_size = min(chunk_size, file_size - offset)
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, 1)
+    if (fmt['tag'], fmt['bits']) not in WAV_SAMPLE_TYPES or fmt['block_align'] != fmt['channels'] * fmt['bits'] // 8:
+        raise ValueError(f'{filepath} stores {fmt["bits"]} bit samples with format tag {fmt["tag"]:#x}, which cannot be memory mapped')
+    dtype, sample_offset, scale = WAV_SAMPLE_TYPES[(fmt['tag'], fmt['bits'])]
+    return {'offset': offset,
+            'frames': chunk_size // fmt['block_align'],
+            'channels': fmt['channels'],
+            'samplerate': fmt['samplerate'],
+            'dtype': dtype,
+            'sample_offset': sample_offset,
+            'scale': scale}
+
+class SvMemmapSource:
+    """Zero-copy handle to an uncompressed PCM or float WAV file.
+    
+    The sample data is exposed as a copy-on-write np.memmap over the file, so opening is instant, only the pages
+    that are touched get read, and processes mapping the same file share the OS page cache. Writes to the map
+    stay private to the process and never reach the file.
+    """
+    def __init__(self, filepath:str) -> None:
+        layout = read_wav_layout(filepath)
+        self.filepath = filepath
+        self.samplerate = layout['samplerate']
+        self.channels = layout['channels']
+        self.frames = layout['frames']
+        self.sample_offset = layout['sample_offset']
+        self.scale = layout['scale']
+        self.raw = np.memmap(filepath, dtype=layout['dtype'], mode='c', offset=layout['offset'], shape=(self.frames, self.channels))
+        
+    def isFloat(self) -> bool:
+        """returns True if the file stores float samples, which need no conversion"""
+        return self.scale is None
+
+    def _convert(self, raw:np.ndarray, dtype) -> np.ndarray:
+        """Converts stored samples to floats in [-1, 1), matching what soundfile would decode"""
+        out = raw.astype(dtype)
+        if self.scale is None:
+            return out
+        if self.sample_offset:
+            out -= self.sample_offset
+        out *= self.scale
+        return out
+
+    def read(self, start:int=0, stop:int=None, dtype='float64') -> np.ndarray:
+        """Converts frames [start, stop) of the file. Always returns a 2D (frames, channels) array"""
+        return self._convert(self.raw[start:stop], dtype)
+
+    def blocks(self, blocksize:int, overlap:int=0, dtype='float64'):
+        """Yields 2D (frames, channels) blocks of the file, converting one block at a time"""
+        start = 0
+        while True:
+            yield self._convert(self.raw[start:start + blocksize], dtype)
+            start += blocksize - overlap
+            if start + overlap >= self.frames:
+                break
@@ -15,6 +15,9 @@ class SvSimplePlot(QWidget):
         self.setLayout(self.main_layout)
 
         self.scatter = None
+        self.envelope = None
+        self.channel = None
+        self.plot_widget.getViewBox().sigXRangeChanged.connect(self._update_envelope)
         # flip y axis
         #self.plot_widget.invertY(True)
         
@@ -29,6 +32,32 @@ class SvSimplePlot(QWidget):
         self.scatter.setPen(pg.mkPen(color=(171, 70, 188), width=1))
         #self.scatter.scene().sigMouseClicked.connect(self.on_point_clicked)
 
+    def draw_envelope(self, envelope, channel=None, x_label='Time', y_label='Amplitude'):
+        """Draws a signal from its SvEnvelope. Only about one min/max pair per pixel of the visible range is plotted,
+        the curve is rebuilt from the matching pyramid level whenever the view is zoomed or panned."""
+        self.draw_signal(np.zeros(0), np.zeros(0), x_label, y_label)
+        self.envelope = envelope
+        self.channel = channel
+        lo, hi = envelope.getRange()
+        if np.ndim(lo):
+            lo, hi = (lo.min(), hi.max()) if channel is None else (lo[channel], hi[channel])
+        view = self.plot_widget.getViewBox()
+        view.disableAutoRange()
+        view.setLimits(xMin=0, xMax=envelope.frames / envelope.samplerate)
+        view.setYRange(float(lo), float(hi))
+        view.setXRange(0, envelope.frames / envelope.samplerate, padding=0)
+        self._update_envelope()
+
+    def _update_envelope(self, *args):
+        if self.envelope is None:
+            return
+        view = self.plot_widget.getViewBox()
+        x0, x1 = view.viewRange()[0]
+        sr = self.envelope.samplerate
+        pixels = max(1, int(view.width()))
+        xs, ys = self.envelope.getView(x0 * sr, x1 * sr, pixels, self.channel)
+        self.scatter.setData(xs / sr, ys)
+
     def on_point_clicked(self, event):
         pos = event.pos()
         clicked_points = self.scatter.pointsAt(pos)
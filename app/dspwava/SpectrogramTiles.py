@@ -0,0 +1,104 @@
+import numpy as np
+import logging
+import threading
+from .Stft import SvStft
+LOGGER = logging.getLogger(__name__)
+# STFT segments (image columns) per tile
+TILE_SEGMENTS = 512
+
+class SvSpectrogramTiles:
+    """Spectrogram of a signal computed on demand in fixed-width tiles, with a pyramid of downsampled tiles for overviews.
+
+    Level 0 holds the full resolution spectrogram, the same segments as SvSignal.getSpectrogram with the same
+    parameters, cut into tiles of tile_segments columns. A level L tile spans 2**L times as many segments: each of its
+    columns is the maximum of two adjacent columns of level L - 1, as the waveform envelope pyramid keeps the min/max,
+    so short transients stay visible in overviews. A coarse tile is reduced from the cached tiles below it, computing
+    the missing ones without keeping them, so the top tile transforms the whole signal once.
+    Multichannel power is averaged over the channels.
+
+    getTile() is thread safe, so tiles can be computed on a pool of worker threads. Results are kept, within
+    max_tiles, in least recently computed order.
+    """
+    def __init__(self, signal, nperseg=256, noverlap=None, nfft=None, window='hann', scaling='density', tile_segments:int=TILE_SEGMENTS, max_tiles:int=1024) -> None:
+        signal.validDataCheck()
+        self.signal = signal
+        self.samplerate = signal.getSampleRate()
+        self.nperseg = nperseg
+        self.noverlap = nperseg // 8 if noverlap is None else noverlap
+        self.step = nperseg - self.noverlap
+        self.nfft = nfft
+        self.window = window
+        self.scaling = scaling
+        self.tile_segments = tile_segments
+        self.max_tiles = max_tiles
+        frames = signal.getNumFrames()
+        self.segments = 0 if frames < nperseg else (frames - nperseg) // self.step + 1
+        base_tiles = max(1, -(-self.segments // tile_segments))
+        # the top level fits the whole signal in one tile
+        self.levels = int(np.ceil(np.log2(base_tiles))) + 1
+        self._stft = SvStft(self.samplerate, nperseg, self.noverlap, nfft, window, scaling)
+        self.frequencies = self._stft.frequencies
+        self._tiles = {}
+        self._lock = threading.Lock()
+
+    def getNumTiles(self, level:int) -> int:
+        """returns the number of tiles of a level"""
+        return max(1, -(-self.segments // (self.tile_segments << level)))
+
+    def getTileSegments(self, level:int, index:int) -> np.ndarray:
+        """returns the indices of the first segments of the columns of a tile, each column spans 2**level segments"""
+        span = self.tile_segments << level
+        return np.arange(index * span, min(self.segments, (index + 1) * span), 1 << level)
+
+    def segmentTime(self, segment) -> np.ndarray:
+        """returns the time in seconds at the centre of a segment, as in the t array of scipy.signal.spectrogram"""
+        return (np.asarray(segment) * self.step + self.nperseg / 2) / self.samplerate
+
+    def levelFor(self, seconds:float, pixels:int) -> int:
+        """returns the coarsest level that still has at least one column per pixel when seconds are shown on pixels"""
+        segments_per_pixel = seconds * self.samplerate / self.step / max(1, pixels)
+        level = int(np.floor(np.log2(segments_per_pixel))) if segments_per_pixel >= 1 else 0
+        return min(max(level, 0), self.levels - 1)
+
+    def tilesBetween(self, level:int, start:float, stop:float) -> range:
+        """returns the indices of the tiles of a level that overlap the time range start to stop in seconds"""
+        span = (self.tile_segments << level) * self.step / self.samplerate
+        first = max(0, int(start // span))
+        return range(first, min(self.getNumTiles(level), int(stop // span) + 1))
+
+    def computeTile(self, level:int, index:int) -> np.ndarray:
+        """Computes the (frequencies, columns) power of a tile. Use getTile to go through the cache."""
+        from .Frames import frame_signal
+        segments = self.getTileSegments(level, index)
+        if len(segments) == 0:
+            return np.zeros((len(self.frequencies), 0))
+        if level > 0:
+            children = [self._cachedTile(level - 1, i) for i in (2 * index, 2 * index + 1) if i < self.getNumTiles(level - 1)]
+            columns = np.concatenate(children, axis=1)
+            return np.maximum.reduceat(columns, np.arange(0, columns.shape[1], 2), axis=1)
+        data = self.signal._readFrames(segments[0] * self.step, segments[-1] * self.step + self.nperseg)
+        # (segments, [channels,] frequencies)
+        power = self._stft._spectra(frame_signal(data, self.nperseg, self.step))
+        if power.ndim == 3:
+            power = power.mean(axis=1)
+        return power.T
+
+    def _cachedTile(self, level:int, index:int) -> np.ndarray:
+        """returns a tile from the cache, or computes it without keeping it"""
+        with self._lock:
+            tile = self._tiles.get((level, index))
+        return self.computeTile(level, index) if tile is None else tile
+
+    def getTile(self, level:int, index:int) -> np.ndarray:
+        """returns the (frequencies, columns) power of a tile, computing it if it is not cached"""
+        key = (level, index)
+        with self._lock:
+            tile = self._tiles.get(key)
+        if tile is None:
+            tile = self.computeTile(level, index)
+            tile.setflags(write=False)
+            with self._lock:
+                self._tiles[key] = tile
+                while len(self._tiles) > self.max_tiles:
+                    self._tiles.pop(next(iter(self._tiles)))
+        return tile
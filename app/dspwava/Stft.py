@@ -0,0 +1,100 @@
+import numpy as np
+import logging
+from .Frames import get_window
+from .Fft import rfft
+LOGGER = logging.getLogger(__name__)
+# segments transformed together, bounds the size of the spectra yielded at once
+DEFAULT_BATCH_FRAMES = 512
+
+class SvStft:
+    """Stateful short-time Fourier transform for chunked or live input.
+
+    Feed chunks of any size (mono or (frames, channels)) to process(), a generator that yields (t, spectrogram)
+    batches as soon as their segments are complete. The output is that of scipy.signal.spectrogram with the same
+    parameters and its default constant detrend and one-sided power:
+    mono input gives (frequencies, segments) batches, multichannel input (channels, frequencies, segments), and t is
+    the time of the segment centres from the start of the stream.
+
+    Samples are kept in a fixed ring buffer of nperseg + batch_frames * step frames. After every batch only the
+    samples the next segment still needs are moved to its front, so memory does not grow with the stream or the
+    chunk size. window is a name or tuple spec as in scipy.signal.get_window, cached per (window, nperseg), or an
+    array of nperseg samples. float32 input is transformed and returned in float32.
+    """
+    def __init__(self, samplerate, nperseg=256, noverlap=None, nfft=None, window='hann', scaling='density', batch_frames:int=DEFAULT_BATCH_FRAMES) -> None:
+        if scaling not in ('density', 'spectrum'):
+            raise ValueError(f"Unknown scaling {scaling!r}, use 'density' or 'spectrum'")
+        self.samplerate = samplerate
+        self.nperseg = nperseg
+        self.noverlap = nperseg // 8 if noverlap is None else noverlap
+        if not 0 <= self.noverlap < nperseg:
+            raise ValueError('noverlap must be less than nperseg')
+        self.nfft = nperseg if nfft is None else nfft
+        if self.nfft < nperseg:
+            raise ValueError('nfft must be greater than or equal to nperseg')
+        self.step = nperseg - self.noverlap
+        # names and (name, parameters) tuples as scipy.signal.get_window takes them, or the window samples
+        self.window = get_window(window, nperseg) if isinstance(window, (str, tuple)) else np.asarray(window)
+        if self.window.shape != (nperseg,):
+            LOGGER.error(f'Window of shape {self.window.shape} for segments of {nperseg} samples')
+            raise ValueError('window must be 1D with nperseg samples')
+        self.scale = float(1.0 / (samplerate * (self.window ** 2).sum()) if scaling == 'density' else 1.0 / self.window.sum() ** 2)
+        self.frequencies = np.fft.rfftfreq(self.nfft, 1 / samplerate)
+        self.batch_frames = batch_frames
+        self.capacity = nperseg + batch_frames * self.step
+        self.reset()
+
+    def reset(self):
+        """Clears the streaming state so a new signal can be processed"""
+        self._ring = None
+        self._fill = 0
+        # index of the next segment, counted from the start of the stream
+        self._segment = 0
+
+    def _spectra(self, segments:np.ndarray) -> np.ndarray:
+        """one-sided power of (segments, [channels,] nperseg) windowed segments, as (segments, [channels,] frequencies)"""
+        segments = segments - segments.mean(axis=-1, keepdims=True)
+        spectrum = rfft(segments * self.window.astype(segments.dtype, copy=False), n=self.nfft, axis=-1)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2) * self.scale
+        # every bin but DC, and Nyquist for an even nfft, holds the power of its negative frequency too
+        power[..., 1:None if self.nfft % 2 else -1] *= 2
+        return power
+
+    def _emit(self):
+        """transforms every complete segment in the ring, then keeps only the samples the next segment needs"""
+        from .Frames import frame_signal
+        segments = frame_signal(self._ring[:self._fill], self.nperseg, self.step)
+        if len(segments) == 0:
+            return None
+        power = np.moveaxis(self._spectra(segments), 0, -1)
+        t = (np.arange(self._segment, self._segment + len(segments)) * self.step + self.nperseg / 2) / self.samplerate
+        self._segment += len(segments)
+        consumed = len(segments) * self.step
+        self._ring[:self._fill - consumed] = self._ring[consumed:self._fill]
+        self._fill -= consumed
+        return t, power
+
+    def process(self, chunk:np.ndarray):
+        """Feeds the next chunk of samples and yields (t, spectrogram) for every batch of segments it completes"""
+        chunk = np.asarray(chunk)
+        if self._ring is None:
+            self._ring = np.empty((self.capacity,) + chunk.shape[1:], dtype=np.result_type(chunk.dtype, np.float32))
+        position = 0
+        while position < len(chunk):
+            take = min(len(chunk) - position, self.capacity - self._fill)
+            self._ring[self._fill:self._fill + take] = chunk[position:position + take]
+            self._fill += take
+            position += take
+            if self._fill == self.capacity:
+                yield self._emit()
+        if self._fill >= self.nperseg:
+            yield self._emit()
+
+    def stream(self, chunks):
+        """Yields (t, spectrogram) batches over an iterable of chunks, such as SvSignal.blocks() or a socket reader"""
+        for chunk in chunks:
+            yield from self.process(chunk)
+
+    def empty(self, channels:int=None) -> tuple[np.ndarray, np.ndarray]:
+        """returns (t, spectrogram) with no segments, shaped like the batches"""
+        shape = (len(self.frequencies), 0) if not channels or channels == 1 else (channels, len(self.frequencies), 0)
+        return np.zeros(0), np.zeros(shape)
@@ -1,10 +1,20 @@
+import os
+import numpy as np
 import pyqtgraph as pg
+from concurrent.futures import ThreadPoolExecutor
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QFormLayout, QLabel, QPushButton
-from PySide6.QtCore import Signal
+from PySide6.QtCore import Signal, QRectF
 from PySide6.QtGui import Qt
-from scipy.signal import spectrogram
+from .SpectrogramTiles import SvSpectrogramTiles
+
+def to_db(spect:np.ndarray) -> np.ndarray:
+    """power to decibels, with silent bins clipped to the smallest positive float"""
+    return 10 * np.log10(np.maximum(spect, np.finfo(np.float64).tiny))
+
 class SvSpectrogram(QWidget):
     point_clicked_signal = Signal(list)
+    # (level, index) of a finished tile, emitted from worker threads and delivered on the GUI thread
+    tile_ready_signal = Signal(int, int)
     def __init__(self, rm=False):
         super().__init__()
         if rm:
@@ -32,4 +42,132 @@ class SvSpectrogram(QWidget):
 
         self.spect = None
         self.signal = None
+        # tiled mode
+        self.tiles = None
+        self.tile_items = {}
+        self.pending = {}
+        self.pool = None
+        self.level = None
+        self.tile_ready_signal.connect(self._show_tile)
+        self.imv.view.sigXRangeChanged.connect(self._request_tiles)
+        self.hist.item.sigLevelsChanged.connect(self._sync_tiles)
+        self.hist.item.sigLookupTableChanged.connect(self._sync_tiles)
+
+    def _set_image(self, image:np.ndarray, pos=(0, 0), scale=(1, 1), autoRange:bool=True):
+        """shows a (frequencies, times) image in the ImageView whatever the configured axis order"""
+        if pg.getConfigOption('imageAxisOrder') != 'row-major':
+            image = image.T
+        self.imv.setImage(image, pos=pos, scale=scale, autoRange=autoRange)
+
+    def draw(self, spect:np.ndarray, f:np.ndarray=None, t:np.ndarray=None):
+        """Draws a precomputed (frequencies, times) power spectrogram in dB, as returned by SvSignal.getSpectrogram.
+        Multichannel spectrograms are averaged over the channels. With f and t the axes are in Hz and seconds."""
+        self.close_tiles()
+        spect = np.asarray(spect)
+        if spect.ndim == 3:
+            spect = spect.mean(axis=0)
+        self.spect = spect
+        pos, scale = (0, 0), (1, 1)
+        if f is not None and t is not None and len(f) > 1 and len(t) > 1:
+            scale = (t[1] - t[0], f[1] - f[0])
+            pos = (t[0] - scale[0] / 2, f[0] - scale[1] / 2)
+        self._set_image(to_db(spect), pos, scale)
+
+    def draw_signal(self, signal, nperseg=256, noverlap=None, nfft=None, window='hann', workers:int=None):
+        """Draws the spectrogram of a signal progressively, in tiles computed on a pool of worker threads.
+
+        The whole recording is shown first from the top of the tile pyramid, a single tile computed by the workers
+        like the others, with a blank placeholder until it arrives. Whenever the view is zoomed or panned, the tiles of
+        the level matching the new resolution are requested for the visible range and drawn over the coarser image as
+        they finish, so the window stays responsive on recordings of any length.
+        """
+        self.close_tiles()
+        self.signal = signal
+        self.tiles = SvSpectrogramTiles(signal, nperseg, noverlap, nfft, window)
+        self.pool = ThreadPoolExecutor(workers or os.cpu_count() or 1, thread_name_prefix='spectrogram')
+        top = self.tiles.levels - 1
+        placeholder = np.zeros((len(self.tiles.frequencies), max(1, len(self.tiles.getTileSegments(top, 0)))))
+        self._set_image(placeholder, *self._tile_geometry(top, 0))
+        self.imv.view.setLimits(xMin=0, xMax=signal.getDuration())
+        # submitted first, so the workers start with it
+        self.pending[(top, 0)] = self.pool.submit(self._compute_tile, top, 0)
+        self._request_tiles()
+
+    def _tile_geometry(self, level:int, index:int):
+        """returns the (pos, scale) that place a tile's pixels on the time and frequency axes, each column covering the
+        2**level segments it is pooled from"""
+        tiles = self.tiles
+        first = index * (tiles.tile_segments << level)
+        dt = (tiles.step << level) / tiles.samplerate
+        df = tiles.frequencies[1] - tiles.frequencies[0] if len(tiles.frequencies) > 1 else 1.0
+        return (tiles.segmentTime(first) - tiles.step / tiles.samplerate / 2, -df / 2), (dt, df)
+
+    def _request_tiles(self, *args):
+        """Submits the tiles of the current view that are neither shown nor pending, and cancels those out of view"""
+        if self.tiles is None:
+            return
+        (start, stop), _ = self.imv.view.viewRange()
+        level = self.tiles.levelFor(stop - start, self.imv.view.width())
+        # the overview is needed whatever the view
+        wanted = {(level, i) for i in self.tiles.tilesBetween(level, start, stop)} | {(self.tiles.levels - 1, 0)}
+        for key in list(self.pending):
+            if key not in wanted and self.pending[key].cancel():
+                del self.pending[key]
+        # finer tiles than the view needs are dropped, coarser ones stay underneath as a fallback
+        for key in list(self.tile_items):
+            if key[0] < level and key not in wanted:
+                self.imv.view.removeItem(self.tile_items.pop(key))
+        self.level = level
+        for key in sorted(wanted, key=lambda k: k[1]):
+            if key in self.tile_items or key in self.pending or key[0] == self.tiles.levels - 1:
+                continue
+            self.pending[key] = self.pool.submit(self._compute_tile, *key)
+
+    def _compute_tile(self, level:int, index:int):
+        self.tiles.getTile(level, index)
+        self.tile_ready_signal.emit(level, index)
+
+    def _show_tile(self, level:int, index:int):
+        self.pending.pop((level, index), None)
+        if self.tiles is None:
+            return
+        if level == self.tiles.levels - 1:
+            # the overview replaces the placeholder, keeping the view the user may have zoomed meanwhile
+            self._set_image(to_db(self.tiles.getTile(level, index)), *self._tile_geometry(level, index), autoRange=False)
+            return
+        if (level, index) in self.tile_items or level > self.level:
+            return
+        # cached by the worker
+        tile = self.tiles.getTile(level, index)
+        pos, scale = self._tile_geometry(level, index)
+        item = pg.ImageItem(to_db(tile), axisOrder='row-major')
+        item.setRect(QRectF(pos[0], pos[1], scale[0] * tile.shape[1], scale[1] * tile.shape[0]))
+        # finer tiles on top
+        item.setZValue(self.tiles.levels - level)
+        self.tile_items[(level, index)] = item
+        self._sync_tile(item)
+        self.imv.view.addItem(item)
+
+    def _sync_tile(self, item:pg.ImageItem):
+        """gives a tile the colour map and levels of the histogram"""
+        item.setLookupTable(self.hist.item.getLookupTable)
+        item.setLevels(self.hist.item.getLevels())
+
+    def _sync_tiles(self, *args):
+        for item in self.tile_items.values():
+            self._sync_tile(item)
+
+    def close_tiles(self):
+        """Stops the tile workers and removes the tiles from the view"""
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+        for item in self.tile_items.values():
+            self.imv.view.removeItem(item)
+        self.tile_items = {}
+        self.pending = {}
+        self.tiles = None
 
+    def closeEvent(self, event):
+        self.close_tiles()
+        super().closeEvent(event)
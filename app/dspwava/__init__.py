@@ -1,2 +1,10 @@
-from .ExtraFilters import (high_pass_filter, low_pass_filter, convolve_audio)
-from .Signal import SvSignal
\ No newline at end of file
+from .ExtraFilters import (high_pass_filter, low_pass_filter, convolve_audio, SvFilter, SvFilterBank, filter_bank, band_edges)
+from .Convolver import SvConvolver
+from .Resampler import SvResampler
+from .Pipeline import SvPipeline
+from .Stft import SvStft
+from .Signal import SvSignal, set_default_dtype, get_default_dtype
+from .Profiler import SvProfiler
+from .DiskCache import SvDiskCache, set_disk_cache, get_disk_cache
+from .Parallel import SvParallel
+from .Fft import SvFftBackend, set_fft_backend, get_fft_backend
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""
+Full-size allocation counts of SvSignal operations.
+
+Every case runs under tracemalloc on a synthetic in-memory signal of --seconds and on one half as long. The growth of
+the peak of traced memory between the two, in units of the growth of the signal's sample array, is the number of
+full-size arrays the operation allocated. Block temporaries and caches have a fixed size and cancel out, so the count
+does not depend on the length of the signal, as long as the shorter one spans several blocks (--seconds of at least
+8 blocks). The streamed cases run on a signal opened with stream=True from a temporary WAV file of the same
+samples, and also count the calls to SvFileSource.read, which decodes the file in one piece: a block-wise operation
+must not make any. The exit code is 1 if any case allocates more than its budget or decodes the whole file.
+tests/test_allocations.py enforces the same budgets under pytest.
+
+    python benchmarks/allocations.py
+"""
+import argparse, os, sys, tempfile, tracemalloc
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+from dspwava.Signal import SvSignal, DEFAULT_BLOCKSIZE
+from dspwava.SignalSource import SvFileSource
+from dspwava import ExtraFilters
+
+def _per_file(s:SvSignal):
+    """the steps of a typical batch pipeline, on a copy"""
+    s = s.copy()
+    ExtraFilters.high_pass_filter(s, 80)
+    s.normalize()
+    s.estimate_frequency()
+
+# name -> (run(signal), setup(signal) -> extra args, budget of full-size allocations)
+CASES = {
+    'copy': (lambda s: s.copy(), None, 0),
+    'normalize': (lambda s: s.normalize(0.9), None, 0),
+    'getNormalized': (lambda s: s.getNormalized(0.9), None, 1),
+    'getNormalized(out)': (lambda s, out: s.getNormalized(0.9, out=out), lambda s: (np.empty_like(s.data),), 0),
+    'getResample(out)': (lambda s, out: s.getResample(s.samplerate // 2, out=out), lambda s: (np.empty((len(s.data) // 2,) + s.data.shape[1:]),), 0),
+    'getPhaseSpace(out)': (lambda s, out: s.getPhaseSpace(out=out), lambda s: (np.empty(len(s.data)),), 0),
+    'estimate_frequency': (lambda s: s.estimate_frequency(), None, 0),
+    'getInstantaneousFrequency': (lambda s: s.getInstantaneousFrequency(), None, 1),
+    'high_pass_filter': (lambda s: ExtraFilters.high_pass_filter(s, 1000), None, 0),
+    'causal low_pass_filter': (lambda s: ExtraFilters.low_pass_filter(s, 1000, zero_phase=False), None, 0),
+    'copy + high_pass_filter': (lambda s: ExtraFilters.high_pass_filter(s.copy(), 1000), None, 1),
+    'per file pipeline': (_per_file, None, 1),
+}
+
+def _inplace_pipeline(s:SvSignal):
+    s.pipeline().high_pass_filter(80).normalize().run(inplace=True)
+
+# name -> (run(streamed signal), budget of full-size allocations)
+STREAMED_CASES = {
+    'streamed pipeline inplace': (_inplace_pipeline, 1),
+    'streamed high_pass_filter': (lambda s: ExtraFilters.high_pass_filter(s, 1000), 1),
+    'streamed causal low_pass_filter': (lambda s: ExtraFilters.low_pass_filter(s, 1000, zero_phase=False), 1),
+}
+
+def synthetic_signal(seconds:float, samplerate:int) -> SvSignal:
+    rng = np.random.default_rng(0)
+    signal = SvSignal(data=rng.standard_normal((int(seconds * samplerate), 2)) * 0.1, sr=samplerate, channels=2)
+    signal.setCacheBudget(0)
+    return signal
+
+def peak_allocation(run, setup, seconds:float, samplerate:int) -> tuple[int, int]:
+    """returns the peak traced memory of run and the size of the signal's sample array, in bytes"""
+    signal = synthetic_signal(seconds, samplerate)
+    args = setup(signal) if setup else ()
+    tracemalloc.start()
+    run(signal, *args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, signal.data.nbytes
+
+def peak_streamed(run, filepath:str) -> tuple[int, int, int]:
+    """returns the peak traced memory of run on a streamed signal and the size of its sample array, in bytes, and the
+    number of whole-file decodes it made"""
+    signal = SvSignal(filepath, stream=True)
+    signal.setCacheBudget(0)
+    nbytes = signal.getNumFrames() * signal.getNumChannels() * signal.getDtype().itemsize
+    reads = []
+    read = SvFileSource.read
+    def spy(source, *args, **kwargs):
+        reads.append(args)
+        return read(source, *args, **kwargs)
+    SvFileSource.read = spy
+    try:
+        tracemalloc.start()
+        run(signal)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        SvFileSource.read = read
+    return peak, nbytes, len(reads)
+
+def full_size_arrays(long:tuple, short:tuple) -> float:
+    """returns the number of full-size arrays from the (peak, nbytes) of a long and a short run"""
+    return (long[0] - short[0]) / (long[1] - short[1])
+
+def min_seconds(samplerate:int) -> float:
+    """returns the shortest --seconds the counts are valid for. Shorter signals do not fill the block temporaries,
+    which then grow with the length too."""
+    return 8 * DEFAULT_BLOCKSIZE / samplerate
+
+def warm_up(samplerate:int):
+    """runs every in-memory case once, so caches of filter designs, windows and imports are not counted"""
+    for run, setup, _ in CASES.values():
+        signal = synthetic_signal(1, samplerate)
+        run(signal, *(setup(signal) if setup else ()))
+
+def case_arrays(name:str, seconds:float, samplerate:int) -> float:
+    """returns the full-size arrays an in-memory case allocates"""
+    run, setup, _ = CASES[name]
+    return full_size_arrays(peak_allocation(run, setup, seconds, samplerate),
+                            peak_allocation(run, setup, seconds / 2, samplerate))
+
+def write_signals(directory:str, seconds:float, samplerate:int) -> tuple[str, str]:
+    """writes the long and short signals of the streamed cases to WAV files in directory, returns their paths"""
+    long, short = os.path.join(directory, 'long.wav'), os.path.join(directory, 'short.wav')
+    sf.write(long, synthetic_signal(seconds, samplerate).data, samplerate, subtype='DOUBLE')
+    sf.write(short, synthetic_signal(seconds / 2, samplerate).data, samplerate, subtype='DOUBLE')
+    return long, short
+
+def streamed_case_arrays(name:str, long:str, short:str) -> tuple[float, int]:
+    """returns the full-size arrays a streamed case allocates and the whole-file decodes it made, after a warm-up run"""
+    run, _ = STREAMED_CASES[name]
+    run(SvSignal(short, stream=True))
+    *long_peak, decodes = peak_streamed(run, long)
+    *short_peak, _ = peak_streamed(run, short)
+    return full_size_arrays(long_peak, short_peak), decodes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=60.0)
+    parser.add_argument('--samplerate', type=int, default=44100)
+    args = parser.parse_args()
+    if args.seconds < min_seconds(args.samplerate):
+        parser.error(f'--seconds must be at least {min_seconds(args.samplerate):.1f} at {args.samplerate} Hz')
+    warm_up(args.samplerate)
+    failures = 0
+    for name, (_, _, budget) in CASES.items():
+        used = case_arrays(name, args.seconds, args.samplerate)
+        ok = round(used) <= budget
+        failures += not ok
+        print(f'{name:<24} {used:6.2f} arrays  budget {budget}  {"ok" if ok else "FAIL"}')
+    with tempfile.TemporaryDirectory() as tmp:
+        long, short = write_signals(tmp, args.seconds, args.samplerate)
+        for name, (_, budget) in STREAMED_CASES.items():
+            used, decodes = streamed_case_arrays(name, long, short)
+            ok = round(used) <= budget and decodes == 0
+            failures += not ok
+            print(f'{name:<32} {used:6.2f} arrays  budget {budget}  {decodes} decodes  {"ok" if ok else "FAIL"}')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
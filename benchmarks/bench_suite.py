@@ -0,0 +1,164 @@
+"""
+Benchmark suite for the SvSignal and ExtraFilters hot paths.
+
+Runs every case over a grid of synthetic signals (length x channels x sample rate), recording the median and best wall
+time, throughput in samples per second and peak traced memory, and saves the results as JSON. With --compare the run is
+checked against a stored baseline and any case whose median time grew by more than --threshold is flagged; the exit
+code is 1 if there are regressions. A baseline of another sample dtype is refused (exit code 2), differences in the grid
+or the environment are reported as warnings.
+
+    python benchmarks/bench_suite.py --output bench.json
+    python benchmarks/bench_suite.py --quick --compare bench.json --threshold 0.15
+"""
+import argparse, itertools, json, os, platform, statistics, sys, time, tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+from dspwava.Signal import SvSignal
+from dspwava import ExtraFilters
+
+GRID = {'seconds': [1, 10, 60], 'channels': [1, 2], 'samplerate': [16000, 44100, 48000]}
+QUICK_GRID = {'seconds': [1, 5], 'channels': [1, 2], 'samplerate': [44100]}
+# seconds of the impulse response used by the convolution case
+IR_SECONDS = 1.0
+# meta entries that change what is measured, a baseline differing in one of them is not compared
+COMPARABLE_META = ('dtype',)
+# meta entries that change the timings or the cases, differences are reported
+ENVIRONMENT_META = ('grid', 'repeat', 'python', 'numpy', 'scipy', 'machine', 'processor')
+
+def synthetic_signal(seconds:float, channels:int, samplerate:int, seed:int=0, dtype:str='float64') -> SvSignal:
+    """A reproducible test signal: a few harmonics of 220 Hz plus low level noise, different per channel"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * samplerate)) / samplerate
+    data = np.stack([sum(np.sin(2 * np.pi * 220 * k * (1 + 0.01 * c) * t) / k for k in (1, 2, 3))
+                     + 0.01 * rng.standard_normal(len(t)) for c in range(channels)], axis=1)
+    data *= 0.5 / np.max(np.abs(data))
+    signal = SvSignal(data=data[:, 0] if channels == 1 else data, sr=samplerate, channels=channels, dtype=dtype)
+    # results must be recomputed on every repeat
+    signal.setCacheBudget(0)
+    return signal
+
+def _ba(signal:SvSignal):
+    from scipy.signal import butter
+    return butter(4, 1000 / (0.5 * signal.samplerate), btype='high')
+
+def _impulse(signal:SvSignal) -> SvSignal:
+    rng = np.random.default_rng(1)
+    n = int(IR_SECONDS * signal.samplerate)
+    return SvSignal(data=rng.standard_normal(n) * np.exp(-np.arange(n) / (0.2 * signal.samplerate)), sr=signal.samplerate)
+
+# name -> (setup(signal) -> args, run(signal, *args)). Setup is not timed. Mutating cases get a fresh copy per repeat.
+CASES = {
+    'estimate_frequency': (None, lambda s: s.estimate_frequency()),
+    'resample': (None, lambda s: s.resample(22050 if s.samplerate != 22050 else 16000)),
+    'getSpectrogram': (None, lambda s: s.getSpectrogram()),
+    'getPhaseSpectrum': (None, lambda s: s.getPhaseSpectrum()),
+    'normalize': (None, lambda s: s.normalize(0.9)),
+    'high_pass_filter': (None, lambda s: ExtraFilters.high_pass_filter(s, 1000)),
+    'low_pass_filter': (None, lambda s: ExtraFilters.low_pass_filter(s, 200)),
+    'apply_filter': (_ba, lambda s, ba: ExtraFilters.apply_filter(ba[0], ba[1], s.data)),
+    'forward_backward_filtering': (_ba, lambda s, ba: ExtraFilters.forward_backward_filtering(ba[0], ba[1], s.data)),
+    'convolve_audio': (_impulse, lambda s, ir: ExtraFilters.convolve_audio(s, ir)),
+}
+
+def run_case(name:str, signal:SvSignal, repeat:int) -> dict:
+    """Times one case on one signal and measures its peak traced memory in a separate run"""
+    setup, run = CASES[name]
+    args = (setup(signal),) if setup else ()
+    times = []
+    # one untimed warm up run, so caches of designs and windows are filled as in steady state
+    for i in range(repeat + 1):
+        # copies keep the zero cache budget of the synthetic signal. They share samples copy-on-write, take a private
+        # copy up front so in place cases do not time it.
+        target = signal.copy()
+        target.getWritableData()
+        start = time.perf_counter()
+        run(target, *args)
+        if i:
+            times.append(time.perf_counter() - start)
+    target = signal.copy()
+    target.getWritableData()
+    tracemalloc.start()
+    run(target, *args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    median = statistics.median(times)
+    samples = signal.getNumFrames() * signal.getNumChannels()
+    return {'case': name, 'frames': signal.getNumFrames(), 'channels': signal.getNumChannels(), 'samplerate': signal.samplerate,
+            'median_s': median, 'min_s': min(times), 'samples_per_s': samples / median if median else float('inf'), 'peak_bytes': peak}
+
+def result_key(result:dict) -> str:
+    return f"{result['case']}/{result['frames']}x{result['channels']}@{result['samplerate']}"
+
+def run_suite(grid:dict, cases:list, repeat:int, dtype:str='float64') -> dict:
+    results = []
+    for seconds, channels, samplerate in itertools.product(grid['seconds'], grid['channels'], grid['samplerate']):
+        signal = synthetic_signal(seconds, channels, samplerate, dtype=dtype)
+        for name in cases:
+            result = run_case(name, signal, repeat)
+            results.append(result)
+            print(f"{result_key(result):<48} {result['median_s'] * 1000:9.2f} ms  {result['samples_per_s'] / 1e6:9.2f} Msamples/s"
+                  f"  peak {result['peak_bytes'] / 2**20:8.1f} MiB", flush=True)
+    import scipy
+    meta = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(), 'numpy': np.__version__,
+            'scipy': scipy.__version__, 'machine': platform.machine(), 'processor': platform.processor(), 'repeat': repeat, 'dtype': dtype,
+            'grid': grid}
+    return {'meta': meta, 'results': results}
+
+def compare(current:dict, baseline:dict, threshold:float) -> list:
+    """Returns (key, baseline median, current median, change) for every case that got slower by more than threshold.
+    Raises ValueError if the baseline measured something else (COMPARABLE_META) or shares no case with the run, and
+    prints a warning for each ENVIRONMENT_META difference and for cases missing from the baseline."""
+    meta, base_meta = current.get('meta', {}), baseline.get('meta', {})
+    # baselines from before the dtype option were float64
+    base_meta = {'dtype': 'float64', **base_meta}
+    for name in COMPARABLE_META:
+        if meta.get(name) != base_meta.get(name):
+            raise ValueError(f'the baseline was run with {name} {base_meta.get(name)!r}, this run with {meta.get(name)!r}')
+    for name in ENVIRONMENT_META:
+        if name in base_meta and meta.get(name) != base_meta[name]:
+            print(f'WARNING baseline {name} {base_meta[name]!r} differs from this run\'s {meta.get(name)!r}')
+    base = {result_key(r): r for r in baseline['results']}
+    missing = [result_key(r) for r in current['results'] if result_key(r) not in base]
+    if len(missing) == len(current['results']):
+        raise ValueError('the baseline has none of the cases of this run')
+    if missing:
+        print(f'WARNING {len(missing)} of {len(current["results"])} cases are not in the baseline and are not compared')
+    regressions = []
+    for result in current['results']:
+        old = base.get(result_key(result))
+        if old is None:
+            continue
+        change = result['median_s'] / old['median_s'] - 1 if old['median_s'] else 0.0
+        if change > threshold:
+            regressions.append((result_key(result), old['median_s'], result['median_s'], change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='JSON file to save the results to')
+    parser.add_argument('--compare', help='baseline JSON file to check the results against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative slow down that counts as a regression')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per case')
+    parser.add_argument('--quick', action='store_true', help='use a small grid')
+    parser.add_argument('--case', action='append', choices=sorted(CASES), help='only run these cases')
+    parser.add_argument('--dtype', default='float64', choices=['float64', 'float32'], help='sample precision of the signals')
+    args = parser.parse_args()
+    report = run_suite(QUICK_GRID if args.quick else GRID, args.case or list(CASES), args.repeat, args.dtype)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'results saved to {args.output}')
+    if args.compare:
+        with open(args.compare) as f:
+            try:
+                regressions = compare(report, json.load(f), args.threshold)
+            except ValueError as e:
+                parser.error(f'cannot compare with {args.compare}: {e}')
+        for key, old, new, change in regressions:
+            print(f'REGRESSION {key}: {old * 1000:.2f} ms -> {new * 1000:.2f} ms (+{change:.0%})')
+        print(f'{len(regressions)} regressions over {args.threshold:.0%}')
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Numerical drift of the float32 processing mode against float64.
+
+Runs every case on the same synthetic signal in both precisions, checks that the float32 path stayed in float32
+(complex64 for spectra) and reports the largest difference relative to the peak of the float64 result. The exit code
+is 1 if any case exceeds its bound or left float32. tests/test_float32.py runs the same checks under pytest.
+
+    python benchmarks/float32_drift.py
+"""
+import argparse, os, sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+from dspwava.Signal import SvSignal
+from dspwava import ExtraFilters
+
+def _impulse(signal:SvSignal) -> SvSignal:
+    rng = np.random.default_rng(1)
+    n = signal.samplerate // 2
+    return SvSignal(data=rng.standard_normal(n) * np.exp(-np.arange(n) / (0.1 * signal.samplerate)), sr=signal.samplerate)
+
+def _pipeline(s:SvSignal):
+    return s.pipeline().toMono().high_pass_filter(1000).low_pass_filter(3000).normalize().run().data
+
+# name -> (run(signal) -> array, bound on the error relative to the float64 peak)
+CASES = {
+    'load': (lambda s: s.data, 1e-7),
+    'normalize': (lambda s: (s.normalize(0.9), s.data)[1], 1e-6),
+    'resample': (lambda s: (s.resample(48000), s.data)[1], 1e-5),
+    'high_pass_filter': (lambda s: ExtraFilters.high_pass_filter(s, 1000).data, 1e-4),
+    'low_pass_filter': (lambda s: ExtraFilters.low_pass_filter(s, 200).data, 1e-3),
+    'causal_filter': (lambda s: ExtraFilters.high_pass_filter(s, 1000, zero_phase=False).data, 1e-4),
+    'getSpectrogram': (lambda s: s.getSpectrogram()[2], 1e-5),
+    # weighted by the bin magnitudes: the angle of a weak bin moves by the rounding of the transform relative to its
+    # magnitude, and phasors do not jump by 2 pi where an angle crosses pi
+    'getPhaseSpectrum': (lambda s: np.abs(np.fft.fft(s.data, axis=0)) * np.exp(1j * s.getPhaseSpectrum()), 1e-5),
+    'convolve_audio': (lambda s: ExtraFilters.convolve_audio(s, _impulse(s)).data, 1e-5),
+    'pipeline': (_pipeline, 1e-3),
+    'estimate_frequency': (lambda s: np.array(s.estimate_frequency()), 0.0),
+    'getInstantaneousFrequency': (lambda s: s.getInstantaneousFrequency(), 1e-4),
+    'getFrameFrequencies': (lambda s: s.getFrameFrequencies()[1], 1e-5),
+}
+
+def synthetic_signal(seconds:float, samplerate:int, dtype:str) -> SvSignal:
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * samplerate)) / samplerate
+    data = np.stack([np.sin(2 * np.pi * 440 * t) + 0.3 * np.sin(2 * np.pi * 3100 * t) + 0.05 * rng.standard_normal(len(t)),
+                     np.sin(2 * np.pi * 660 * t) + 0.05 * rng.standard_normal(len(t))], axis=1) * 0.4
+    return SvSignal(data=data.astype(dtype), sr=samplerate, channels=2)
+
+def drift(name:str, seconds:float, samplerate:int) -> tuple[float, np.dtype, bool]:
+    """returns the drift of a case relative to the float64 peak, the dtype of its float32 result, and whether it is
+    within the case's bound and stayed in float32"""
+    run, bound = CASES[name]
+    reference = np.asarray(run(synthetic_signal(seconds, samplerate, 'float64')))
+    result = np.asarray(run(synthetic_signal(seconds, samplerate, 'float32')))
+    expected = np.complex64 if np.iscomplexobj(reference) else np.float32
+    peak = np.max(np.abs(reference)) or 1.0
+    error = np.max(np.abs(result.astype(reference.dtype) - reference)) / peak
+    return error, result.dtype, error <= bound and (result.ndim == 0 or result.dtype == expected)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--samplerate', type=int, default=44100)
+    args = parser.parse_args()
+    failures = 0
+    for name, (_, bound) in CASES.items():
+        error, dtype, ok = drift(name, args.seconds, args.samplerate)
+        failures += not ok
+        print(f'{name:<20} {str(dtype):<10} drift {error:9.2e}  bound {bound:7.0e}  {"ok" if ok else "FAIL"}')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Cold start benchmark for the headless numeric core.
+
+Imports the core modules in fresh interpreters and fails (exit code 1) if the median import time is over the budget,
+or if importing them pulls in Qt, pyqtgraph or scipy.signal, which must only load when they are first used.
+
+    python benchmarks/import_time.py --budget 0.5 --repeat 7
+"""
+import argparse, json, os, statistics, subprocess, sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+CORE_MODULES = ['dspwava', 'dspwava.Signal', 'dspwava.ExtraFilters']
+# modules the core must not import eagerly
+DEFERRED_MODULES = ['PySide6', 'pyqtgraph', 'scipy.signal']
+# seconds allowed for a cold import of the core
+DEFAULT_BUDGET = 0.5
+
+PROBE = '''
+import sys, time, json
+sys.path.insert(0, {app_dir!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [m for m in {deferred!r} if m in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "loaded": loaded}}))
+'''
+
+def measure(module:str, repeat:int) -> dict:
+    """Imports module in repeat fresh interpreters and returns the median time and any deferred modules it loaded"""
+    times, loaded = [], set()
+    for _ in range(repeat):
+        code = PROBE.format(app_dir=APP_DIR, module=module, deferred=DEFERRED_MODULES)
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        times.append(result['elapsed'])
+        loaded.update(result['loaded'])
+    return {'module': module, 'median': statistics.median(times), 'min': min(times), 'loaded': sorted(loaded)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help='seconds allowed for a cold import')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per module')
+    args = parser.parse_args()
+    failed = False
+    for module in CORE_MODULES:
+        result = measure(module, args.repeat)
+        over = result['median'] > args.budget
+        failed |= over or bool(result['loaded'])
+        print(f"{module:<24} median {result['median'] * 1000:7.1f} ms  min {result['min'] * 1000:7.1f} ms"
+              f"{'  OVER BUDGET' if over else ''}{'  loaded ' + ', '.join(result['loaded']) if result['loaded'] else ''}")
+    print(f'budget {args.budget * 1000:.0f} ms: {"FAIL" if failed else "OK"}')
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -31,5 +31,8 @@ setup (
                       "soundfile==0.12.1" 
                       ],
     python_requires='>=3.8',
+    entry_points={
+        "console_scripts": ["dspwava-batch=dspwava.Batch:main", "dspwava-serve=dspwava.Service:main"],
+    },
    
 )
\ No newline at end of file
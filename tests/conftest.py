@@ -0,0 +1,6 @@
+import os, sys
+
+# the package lives in app/ and the checks shared with the benchmark scripts in benchmarks/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
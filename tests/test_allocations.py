@@ -0,0 +1,25 @@
+"""Budgets of full-size allocations of SvSignal operations, see benchmarks/allocations.py"""
+import pytest
+import allocations
+
+SAMPLERATE = 44100
+SECONDS = max(12.0, allocations.min_seconds(SAMPLERATE))
+
+@pytest.fixture(scope='module', autouse=True)
+def warm_up():
+    allocations.warm_up(SAMPLERATE)
+
+@pytest.fixture(scope='module')
+def streamed_files(tmp_path_factory):
+    return allocations.write_signals(str(tmp_path_factory.mktemp('signals')), SECONDS, SAMPLERATE)
+
+@pytest.mark.parametrize('name', list(allocations.CASES))
+def test_full_size_allocations(name):
+    used = allocations.case_arrays(name, SECONDS, SAMPLERATE)
+    assert round(used) <= allocations.CASES[name][2], f'{name} allocates {used:.2f} full-size arrays'
+
+@pytest.mark.parametrize('name', list(allocations.STREAMED_CASES))
+def test_streamed_allocations(name, streamed_files):
+    used, decodes = allocations.streamed_case_arrays(name, *streamed_files)
+    assert decodes == 0, f'{name} decoded the whole file'
+    assert round(used) <= allocations.STREAMED_CASES[name][1], f'{name} allocates {used:.2f} full-size arrays'
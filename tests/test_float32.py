@@ -0,0 +1,11 @@
+"""Bounds on the numerical drift of the float32 processing mode against float64, see benchmarks/float32_drift.py"""
+import pytest
+import float32_drift
+
+SECONDS = 3.0
+SAMPLERATE = 44100
+
+@pytest.mark.parametrize('name', list(float32_drift.CASES))
+def test_float32_drift(name):
+    error, dtype, ok = float32_drift.drift(name, SECONDS, SAMPLERATE)
+    assert ok, f'{name}: {dtype} result drifts {error:.2e}, bound {float32_drift.CASES[name][1]:.0e}'